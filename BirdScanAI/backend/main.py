@@ -1,18 +1,52 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from ultralytics import YOLO
 import os
+import sys
+import platform
+import atexit
+import logging
+import logging.handlers
+import math
+import socket
+import ssl
+import subprocess
+from functools import wraps
+import io
+import hashlib
+import hmac
+import queue
+from contextlib import contextmanager
+import threading
+import json
+import random
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import torch
 import time
-from PIL import Image
+from PIL import Image, ImageOps
 import torchvision.transforms as transforms
 import torchvision.models as models
 import torch.nn as nn
 import torch.nn.functional as F
 
+try:
+    import fcntl  # POSIX only: picks the single process that evicts uploads
+except ImportError:
+    fcntl = None
+try:
+    import orjson  # Optional: much faster parsing of the ~17k-entry eBird taxonomy
+except ImportError:
+    orjson = None
+
 # Patch torch.load to use weights_only=False for PyTorch 2.6+ compatibility
 original_load = torch.load
 def patched_load(*args, **kwargs):
@@ -20,6 +54,106 @@ def patched_load(*args, **kwargs):
     return original_load(*args, **kwargs)
 torch.load = patched_load
 
+def run_in_each_process(fn):
+    """
+    Call fn now and again in every forked child. Threads do not survive fork, so
+    under pre-forking servers (gunicorn --preload) background threads started at
+    import would otherwise exist only in the master process.
+    """
+    fn()
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=fn)
+
+
+# --- Structured, non-blocking logging ---
+# Request threads only put LogRecords on a queue; formatting (JSON lines) and
+# the stdout write happen on a QueueListener thread. If the queue is full the
+# record is dropped rather than blocking a request. Verbose debug payloads are
+# built lazily and only for a sampled fraction of requests.
+LOG_LEVEL = os.environ.get("BIRDSCAN_LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = 0.01  # Share of requests whose verbose debug payloads are logged
+LOG_QUEUE_SIZE = 10000
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line; structured fields come from extra={"fields": {...}}."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers all formatting to the listener and never blocks."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # The stdlib version formats the message here, on the caller's thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+LOG_LISTENER = {"listener": None}
+
+
+def setup_logging():
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonLogFormatter())
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+
+    def start_listener():
+        # Fresh queue per process: the parent's may have been mid-operation at fork
+        handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+        listener.start()
+        LOG_LISTENER["listener"] = listener
+
+    run_in_each_process(start_listener)
+    atexit.register(lambda: LOG_LISTENER["listener"].stop())
+    birdscan_logger = logging.getLogger("birdscan")
+    birdscan_logger.setLevel(LOG_LEVEL)
+    birdscan_logger.addHandler(handler)
+    birdscan_logger.propagate = False
+    return birdscan_logger
+
+
+logger = setup_logging()
+
+
+def debug_sampled():
+    """Whether this request's verbose debug payloads should be logged (decided once per request)."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    try:
+        if "log_sampled" not in g:
+            g.log_sampled = request.headers.get("X-Debug-Log") == "1" or random.random() < LOG_DEBUG_SAMPLE_RATE
+        return g.log_sampled
+    except RuntimeError:
+        return False  # Outside a request
+
+
+def log_debug_sampled(message, payload_fn):
+    """Log a verbose payload at DEBUG for sampled requests; payload_fn runs only if it will be logged."""
+    if debug_sampled():
+        logger.debug(message, extra={"fields": payload_fn()})
+
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
@@ -32,33 +166,337 @@ def add_cors_headers(resp):
     resp.headers['Access-Control-Allow-Origin'] = origin if origin else '*'
     resp.headers['Vary'] = 'Origin'
     resp.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Deadline-Ms, If-None-Match, If-Modified-Since, X-Admin-Token, X-Debug-Log'
+    resp.headers['Access-Control-Expose-Headers'] = 'ETag, Last-Modified, Cache-Control, Retry-After'
     return resp
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Uploads are read into memory whole, so cap the request body size
+MAX_UPLOAD_REQUEST_BYTES = 25 * 1024 * 1024  # 25 MB
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_REQUEST_BYTES
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    limit_mb = MAX_UPLOAD_REQUEST_BYTES // (1024 * 1024)
+    return jsonify({'message': f'Upload too large. The maximum request size is {limit_mb} MB.'}), 413
+
+# --- Content-addressed upload store ---
+# Uploads are kept under their SHA-256 in a two-level sharded layout
+# (uploads/ab/cd/abcd....jpg) so identical images are stored once and no single
+# directory grows without bound. Writes and evictions happen on a background
+# thread; the request path only hashes the bytes and enqueues them. With several
+# worker processes sharing the directory, each one rescans it periodically and
+# only the process holding uploads/.evict.lock evicts, so the limits below apply
+# to the directory as a whole rather than per worker.
+UPLOAD_RETENTION_ENABLED = True
+UPLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+UPLOAD_MAX_FILES = 20000
+UPLOAD_MAX_AGE_SECONDS = 7 * 24 * 60 * 60  # 7 days
+UPLOAD_WRITE_QUEUE_SIZE = 64
+UPLOAD_EVICT_INTERVAL_SECONDS = 60
+
+IMAGE_FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif", "BMP": ".bmp"}
+
+
+class UploadStore:
+    """Bounded, deduplicating on-disk store for uploaded images with LRU eviction."""
+
+    def __init__(self, root, max_bytes, max_files, max_age_seconds, enabled=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self._index = OrderedDict()  # relative path -> [size, last_access], oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=UPLOAD_WRITE_QUEUE_SIZE)
+        self._dropped = 0
+        self._evict_lock_file = None
+        if enabled:
+            run_in_each_process(self._start_writer)
+
+    def _start_writer(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=UPLOAD_WRITE_QUEUE_SIZE)
+        if self._evict_lock_file is not None:
+            # Inherited across fork: the parent keeps the eviction lock, not this child
+            self._evict_lock_file.close()
+            self._evict_lock_file = None
+        threading.Thread(target=self._writer_loop, name="upload-store", daemon=True).start()
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def relative_path(digest, ext):
+        return os.path.join(digest[:2], digest[2:4], digest + ext)
+
+    def put(self, data, image_format=None):
+        """Hash the bytes and queue them for writing; returns the content id."""
+        digest = self.digest(data)
+        if not self.enabled:
+            return digest
+        rel = self.relative_path(digest, IMAGE_FORMAT_EXTENSIONS.get(image_format or "", ".img"))
+        with self._lock:
+            hit = rel in self._index
+            if hit:
+                # Duplicate image: just refresh its LRU position
+                self._index[rel][1] = time.time()
+                self._index.move_to_end(rel)
+        if hit and self._touch(rel):
+            return digest
+        try:
+            self._queue.put_nowait((rel, data))
+        except queue.Full:
+            self._dropped += 1
+            logger.warning("Upload store queue full, not retaining %s", digest)
+        return digest
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "files": len(self._index),
+                "bytes": self._total_bytes,
+                "pending_writes": self._queue.qsize(),
+                "dropped_writes": self._dropped
+            }
+
+    def _writer_loop(self):
+        self._load_index()
+        last_scan = time.time()
+        while True:
+            try:
+                rel, data = self._queue.get(timeout=UPLOAD_EVICT_INTERVAL_SECONDS)
+                self._write(rel, data)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error("Upload store write error: %s", e)
+            now = time.time()
+            try:
+                if (now - last_scan) >= UPLOAD_EVICT_INTERVAL_SECONDS:
+                    # Pick up files written and evicted by other worker processes
+                    self._load_index()
+                    last_scan = now
+                    if self._owns_eviction():
+                        self._evict(now)
+                elif self._over_limits() and self._owns_eviction():
+                    self._evict(now)
+            except Exception as e:
+                logger.error("Upload store eviction error: %s", e)
+
+    def _write(self, rel, data):
+        with self._lock:
+            hit = rel in self._index
+            if hit:
+                self._index[rel][1] = time.time()
+                self._index.move_to_end(rel)
+        if hit and self._touch(rel):
+            return
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._index[rel] = [len(data), time.time()]
+            self._total_bytes += len(data)
+
+    def _touch(self, rel):
+        """
+        Bump the file's mtime (_load_index orders by it, so hits survive a restart).
+        Returns False, and forgets the entry, if the file is gone so the caller rewrites it.
+        """
+        try:
+            os.utime(os.path.join(self.root, rel))
+            return True
+        except FileNotFoundError:
+            # Evicted by another worker process
+            with self._lock:
+                entry = self._index.pop(rel, None)
+                if entry is not None:
+                    self._total_bytes -= entry[0]
+            return False
+        except OSError:
+            return True
+
+    def _owns_eviction(self):
+        """Whether this process holds the directory's eviction lock (taken on first success)."""
+        if self._evict_lock_file is not None or fcntl is None:
+            return True
+        fh = open(os.path.join(self.root, ".evict.lock"), "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._evict_lock_file = fh
+        return True
+
+    def _load_index(self):
+        """Rebuild the LRU index from disk (oldest mtime first), including legacy flat uploads."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith("."):
+                    continue  # .evict.lock
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith(".tmp"):
+                        # Only stale leftovers: another worker process may be mid-write
+                        if time.time() - st.st_mtime > UPLOAD_EVICT_INTERVAL_SECONDS:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, os.path.relpath(path, self.root), st.st_size))
+        entries.sort()
+        index = OrderedDict((rel, [size, mtime]) for mtime, rel, size in entries)
+        with self._lock:
+            self._index = index
+            self._total_bytes = sum(size for _, _, size in entries)
+
+    def _over_limits(self):
+        with self._lock:
+            return len(self._index) > self.max_files or self._total_bytes > self.max_bytes
+
+    def _evict(self, now):
+        victims = []
+        with self._lock:
+            while self._index:
+                rel, (size, last_access) = next(iter(self._index.items()))
+                too_old = (now - last_access) > self.max_age_seconds
+                if not (too_old or len(self._index) > self.max_files or self._total_bytes > self.max_bytes):
+                    break
+                self._index.popitem(last=False)
+                self._total_bytes -= size
+                victims.append(rel)
+        for rel in victims:
+            path = os.path.join(self.root, rel)
+            try:
+                os.remove(path)
+                # Drop shard directories once they are empty
+                shard = os.path.dirname(path)
+                while os.path.abspath(shard) != os.path.abspath(self.root) and not os.listdir(shard):
+                    os.rmdir(shard)
+                    shard = os.path.dirname(shard)
+            except OSError:
+                pass
+        if victims:
+            logger.info("Upload store evicted %d file(s)", len(victims))
+
+
+upload_store = UploadStore(
+    UPLOAD_FOLDER,
+    max_bytes=UPLOAD_MAX_BYTES,
+    max_files=UPLOAD_MAX_FILES,
+    max_age_seconds=UPLOAD_MAX_AGE_SECONDS,
+    enabled=UPLOAD_RETENTION_ENABLED
+)
+
+# --- CPU inference settings (autotuned per host type) ---
+# Threads per request, inference concurrency, interop threads, channels-last
+# layout and classifier batch size are chosen by the autotuner (see
+# run_autotune) and saved per host fingerprint. A saved profile is applied
+# here, before any model runs, because torch only accepts
+# set_num_interop_threads before its first parallel work.
+AUTOTUNE_PROFILE_PATH = "inference_profiles.json"
+AUTOTUNE_ON_STARTUP = False  # Benchmark in the background at startup if this host type has no profile
+AUTOTUNE_REPEATS = 5
+AUTOTUNE_BATCH_SIZES = (1, 2, 4, 8)
+AUTOTUNE_TOLERANCE = 1.05  # Results within 5% of the fastest count as ties
+AUTOTUNE_DRAIN_TIMEOUT_SECONDS = 60  # Wait this long for in-flight inference before giving up
+
+INFERENCE_SETTINGS = {
+    "num_threads": torch.get_num_threads(),
+    "interop_threads": torch.get_num_interop_threads(),
+    "channels_last": False,
+    "classifier_batch_size": 8
+}
+
+
+def host_fingerprint():
+    """Identifies a host *type* (CPU model, core count, torch build) so nodes of one kind share a profile."""
+    cpu_model = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as fh:
+            for line in fh:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{cpu_model}|{os.cpu_count()}|torch-{torch.__version__}"
+
+
+def load_inference_profile():
+    try:
+        with open(AUTOTUNE_PROFILE_PATH) as fh:
+            return json.load(fh).get(host_fingerprint())
+    except (OSError, ValueError):
+        return None
+
+
+def save_inference_profile(profile):
+    try:
+        with open(AUTOTUNE_PROFILE_PATH) as fh:
+            profiles = json.load(fh)
+    except (OSError, ValueError):
+        profiles = {}
+    profiles[host_fingerprint()] = profile
+    tmp_path = AUTOTUNE_PROFILE_PATH + ".tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(profiles, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, AUTOTUNE_PROFILE_PATH)
+
+
+def apply_thread_settings(profile, startup=False):
+    torch.set_num_threads(int(profile["num_threads"]))
+    INFERENCE_SETTINGS["num_threads"] = int(profile["num_threads"])
+    if startup and profile.get("interop_threads"):
+        try:
+            torch.set_num_interop_threads(int(profile["interop_threads"]))
+            INFERENCE_SETTINGS["interop_threads"] = int(profile["interop_threads"])
+        except RuntimeError as e:
+            logger.warning("Could not set interop threads: %s", e)
+    INFERENCE_SETTINGS["channels_last"] = bool(profile.get("channels_last", False))
+    INFERENCE_SETTINGS["classifier_batch_size"] = int(profile.get("classifier_batch_size", 8))
+
+
+SAVED_INFERENCE_PROFILE = load_inference_profile()
+if SAVED_INFERENCE_PROFILE:
+    apply_thread_settings(SAVED_INFERENCE_PROFILE, startup=True)
+    logger.info("Applied saved inference profile", extra={"fields": {"profile": INFERENCE_SETTINGS}})
+
 # Load a pre-trained YOLO model that can detect birds
 # Using YOLOv8n which can detect various objects including birds
-print("Loading YOLO model...")
+logger.info("Loading YOLO model...")
 
 try:
     model = YOLO("yolov8n.pt")
-    print("YOLO model loaded successfully!")
+    logger.info("YOLO model loaded successfully!")
 except Exception as e:
-    print(f"Error loading model: {e}")
-    print("Downloading fresh model...")
+    logger.error("Error loading model: %s", e)
+    logger.info("Downloading fresh model...")
     # Remove old model and download fresh
     if os.path.exists("yolov8n.pt"):
         os.remove("yolov8n.pt")
     model = YOLO("yolov8n.pt")  # This will download fresh
-    print("Fresh YOLO model downloaded and loaded!")
+    logger.info("Fresh YOLO model downloaded and loaded!")
 
 # Bird species identification using image analysis and eBird data
-print("Loading bird identification system...")
+logger.info("Loading bird identification system...")
 
 # Pre-trained bird species classification model
-print("Loading pre-trained bird species classifier...")
+logger.info("Loading pre-trained bird species classifier...")
 
 # Bird species classes (ImageNet classes for birds)
 BIRD_CLASSES = [
@@ -103,9 +541,9 @@ try:
     num_classes = len(BIRD_CLASSES)
     bird_classifier.fc = nn.Linear(bird_classifier.fc.in_features, num_classes)
     bird_classifier.eval()
-    print("Pre-trained ResNet50 bird classifier loaded successfully!")
+    logger.info("Pre-trained ResNet50 bird classifier loaded successfully!")
 except Exception as e:
-    print(f"Error loading pre-trained model: {e}")
+    logger.error("Error loading pre-trained model: %s", e)
     # Fallback to a simpler model
     bird_classifier = None
 
@@ -116,42 +554,511 @@ transform = transforms.Compose([
     transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
 ])
 
+# --- Model registry: hot-swappable detector and classifier versions ---
+# Requests take a snapshot of the active versions when they start, so a swap
+# only affects the next request. New weights are loaded and warmed on a
+# background thread and swapped in atomically; the previous version is kept for
+# rollback. Trained weights are discovered under runs/detect/*/weights and
+# runs/classify/*/weights (Ultralytics layout).
+MODEL_RUNS_DIR = "runs"
+MODEL_WATCH_ENABLED = False  # Auto-load newer trained weights as they appear
+MODEL_WATCH_INTERVAL_SECONDS = 60
+MODEL_ADMIN_TOKEN = os.environ.get("BIRDSCAN_ADMIN_TOKEN")  # Unset: admin routes are disabled
+MODEL_KINDS = {"detector": "detect", "classifier": "classify"}
+
+
+class ModelVersion:
+    """One loaded model plus what is needed to run and describe it."""
+
+    def __init__(self, kind, version, model, source, class_names=None, backend="ultralytics"):
+        self.kind = kind
+        self.version = version
+        self.model = model
+        self.source = source
+        self.class_names = class_names
+        self.backend = backend  # "ultralytics" or "torch" (the ResNet head)
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "backend": self.backend,
+            "loaded_at": self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """Active/previous model versions per kind, with background load and atomic swap."""
+
+    def __init__(self):
+        self._active = {}
+        self._previous = {}
+        self._loading = {}
+        self._held_back = {}  # kind -> version the watcher must not (re)load, after a rollback or pin
+        self._lock = threading.Lock()
+
+    def register(self, version):
+        with self._lock:
+            if version.kind in self._active:
+                self._previous[version.kind] = self._active[version.kind]
+            self._active[version.kind] = version
+
+    def active(self, kind):
+        return self._active.get(kind)
+
+    def snapshot(self):
+        """Consistent set of versions for one request."""
+        with self._lock:
+            return dict(self._active)
+
+    def versions(self):
+        snap = self.snapshot()
+        return {kind: (v.version if v is not None else None) for kind, v in snap.items()}
+
+    def rollback(self, kind):
+        with self._lock:
+            previous = self._previous.get(kind)
+            if previous is None:
+                return None
+            rolled_back = self._active.get(kind)
+            self._previous[kind] = rolled_back
+            self._active[kind] = previous
+            if rolled_back is not None:
+                self._held_back[kind] = rolled_back.version
+            return previous
+
+    def hold_back(self, kind, version_name):
+        """Keep the watcher from loading version_name; newer weights still load."""
+        with self._lock:
+            if version_name:
+                self._held_back[kind] = version_name
+            else:
+                self._held_back.pop(kind, None)
+
+    def held_back(self, kind):
+        return self._held_back.get(kind)
+
+    def load_async(self, kind, source):
+        """Load, warm and swap in a new version on a background thread. Returns False if one is already loading."""
+        with self._lock:
+            if self._loading.get(kind):
+                return False
+            self._loading[kind] = source
+        threading.Thread(target=self._load_and_swap, args=(kind, source), name=f"model-load-{kind}", daemon=True).start()
+        return True
+
+    def _load_and_swap(self, kind, source):
+        try:
+            logger.info("Loading %s from %s...", kind, source)
+            version = load_model_version(kind, source)
+            warm_model_version(version)
+            self.register(version)
+            logger.info("Swapped in %s version %s", kind, version.version)
+        except Exception as e:
+            logger.error("Error loading %s from %s: %s", kind, source, e)
+        finally:
+            with self._lock:
+                self._loading.pop(kind, None)
+
+    def status(self):
+        with self._lock:
+            return {
+                kind: {
+                    "active": self._active[kind].describe() if self._active.get(kind) else None,
+                    "previous": self._previous[kind].describe() if self._previous.get(kind) else None,
+                    "loading": self._loading.get(kind),
+                    "held_back": self._held_back.get(kind)
+                }
+                for kind in MODEL_KINDS
+            }
+
+
+def weights_version_name(path):
+    """Readable, unique version id for a weights file, e.g. train3-best-1712345678."""
+    run_dir = os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(path))))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{run_dir}-{stem}-{int(os.path.getmtime(path))}"
+
+
+def discover_latest_weights(kind):
+    """Newest best.pt under runs/<task>/*/weights for this kind, or None."""
+    task_dir = os.path.join(MODEL_RUNS_DIR, MODEL_KINDS[kind])
+    if not os.path.isdir(task_dir):
+        return None
+    candidates = []
+    for run in os.listdir(task_dir):
+        path = os.path.join(task_dir, run, "weights", "best.pt")
+        if os.path.isfile(path):
+            candidates.append((os.path.getmtime(path), path))
+    return max(candidates)[1] if candidates else None
+
+
+def resolve_weights_source(kind, source):
+    """'latest' or a .pt path inside this backend directory; anything else is rejected."""
+    if source in (None, "", "latest"):
+        return discover_latest_weights(kind)
+    if not isinstance(source, str):
+        return None
+    path = os.path.realpath(source)
+    base = os.path.realpath(os.getcwd())
+    if not path.startswith(base + os.sep) or not path.endswith(".pt") or not os.path.isfile(path):
+        return None
+    return path
+
+
+def yolo_class_names(yolo):
+    """Class names of an Ultralytics model as a list indexed by class id."""
+    names = yolo.names
+    return [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+
+
+def load_model_version(kind, path):
+    yolo = YOLO(path)
+    # Detectors need names too: fine-tuned weights (bird.yaml) have 'bird' as class 0, not COCO 14
+    return ModelVersion(kind, weights_version_name(path), yolo, path, class_names=yolo_class_names(yolo))
+
+
+def warm_model_version(version):
+    """Run a throwaway inference so the first real request does not pay for lazy init."""
+    if version.kind == "detector":
+        version.model(Image.new("RGB", (640, 640)), conf=0.1, verbose=False)
+    else:
+        classifier_probabilities(version, [Image.new("RGB", (224, 224))])
+
+
+def classifier_probabilities(version, crops):
+    """Class probabilities [N, C] for a list of PIL crops, run in chunks of the tuned batch size."""
+    size = max(1, INFERENCE_SETTINGS["classifier_batch_size"])
+    chunks = [_classifier_forward(version, crops[i:i + size]) for i in range(0, len(crops), size)]
+    return torch.cat(chunks, dim=0)
+
+
+def _classifier_forward(version, crops, channels_last=None):
+    if version.backend == "torch":
+        batch = torch.cat([transform(c).unsqueeze(0) for c in crops], dim=0)
+        if INFERENCE_SETTINGS["channels_last"] if channels_last is None else channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            return F.softmax(version.model(batch), dim=1)
+    results = version.model(crops, imgsz=224, verbose=False)
+    return torch.stack([r.probs.data.float() for r in results])
+
+
+def set_classifier_memory_format(version, channels_last):
+    """Convert a torch-backend classifier's weights to (or from) channels-last layout."""
+    if version is not None and version.backend == "torch":
+        version.model.to(memory_format=torch.channels_last if channels_last else torch.contiguous_format)
+
+
+def check_for_new_weights(kind):
+    """Start loading the newest weights for kind if they are not active and not held back."""
+    path = discover_latest_weights(kind)
+    if not path:
+        return False
+    latest = weights_version_name(path)
+    current = MODEL_REGISTRY.active(kind)
+    # Skip weights an operator rolled back from or pinned past until newer ones appear
+    if latest == MODEL_REGISTRY.held_back(kind):
+        return False
+    if current is not None and current.version == latest:
+        return False
+    return MODEL_REGISTRY.load_async(kind, path)
+
+
+def _model_watch_loop():
+    while True:
+        time.sleep(MODEL_WATCH_INTERVAL_SECONDS)
+        for kind in MODEL_KINDS:
+            try:
+                check_for_new_weights(kind)
+            except Exception as e:
+                logger.warning("Error checking for new %s weights: %s", kind, e)
+
+
+MODEL_REGISTRY = ModelRegistry()
+MODEL_REGISTRY.register(ModelVersion("detector", "yolov8n", model, "yolov8n.pt", class_names=yolo_class_names(model)))
+if bird_classifier is not None:
+    MODEL_REGISTRY.register(ModelVersion(
+        "classifier", "resnet50-imagenet", bird_classifier, "torchvision:resnet50",
+        class_names=BIRD_CLASSES, backend="torch"
+    ))
+def _reset_model_loads():
+    # Loader threads from before a fork are gone in the child
+    MODEL_REGISTRY._loading.clear()
+
+
+run_in_each_process(_reset_model_loads)
+if MODEL_WATCH_ENABLED:
+    run_in_each_process(lambda: threading.Thread(target=_model_watch_loop, name="model-watch", daemon=True).start())
+
+if SAVED_INFERENCE_PROFILE:
+    set_classifier_memory_format(MODEL_REGISTRY.active("classifier"), INFERENCE_SETTINGS["channels_last"])
+
+# --- CPU inference autotuner ---
+AUTOTUNE_STATE = {"running": False, "last_error": None, "profile": SAVED_INFERENCE_PROFILE}
+_autotune_lock = threading.Lock()
+run_in_each_process(lambda: AUTOTUNE_STATE.update(running=False))
+
+
+def _median_ms(fn, repeats=AUTOTUNE_REPEATS):
+    fn()  # warm-up run, not timed
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000.0)
+    return float(np.median(times))
+
+
+def _throughput(fn, concurrency, repeats=AUTOTUNE_REPEATS):
+    """
+    Run fn `repeats` times on each of `concurrency` threads at once, the way the
+    inference gate runs requests. Returns (requests per second, median latency in ms).
+    """
+    fn()  # warm-up run, not timed
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn()
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000.0)
+
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return concurrency * repeats / (time.perf_counter() - started), float(np.median(latencies))
+
+
+def _slot_candidates():
+    """
+    (threads per request, concurrent requests) pairs that fill the cores without
+    oversubscribing them, from one wide request to one single-threaded request per core.
+    """
+    cores = os.cpu_count() or 1
+    threads = {cores}
+    n = 1
+    while n < cores:
+        threads.add(n)
+        n *= 2
+    return [(t, max(1, cores // t)) for t in sorted(threads)]
+
+
+def _pick_fastest(throughputs, tiebreak):
+    """Highest throughput; among configurations within tolerance of it, the lowest tiebreak value."""
+    best = max(throughputs.values())
+    close = [key for key, rps in throughputs.items() if rps * AUTOTUNE_TOLERANCE >= best]
+    return min(close, key=lambda key: (tiebreak[key], key))
+
+
+# Interop threads can only be set once per process, before any parallel work,
+# so each candidate is benchmarked in a fresh interpreter running the detector.
+AUTOTUNE_INTEROP_CANDIDATES = (1, 2, 4)
+AUTOTUNE_INTEROP_TIMEOUT_SECONDS = 300
+AUTOTUNE_INTEROP_SCRIPT = r"""
+import json, sys, threading, time
+import numpy as np, torch
+cfg = json.loads(sys.argv[1])
+torch.set_num_interop_threads(cfg["interop_threads"])
+torch.set_num_threads(cfg["num_threads"])
+from PIL import Image
+from ultralytics import YOLO
+detector = YOLO(cfg["detector"])
+frame = Image.fromarray(np.random.default_rng(0).integers(0, 255, (640, 640, 3), dtype=np.uint8))
+detector(frame, conf=0.1, verbose=False)
+def worker():
+    for _ in range(cfg["repeats"]):
+        detector(frame, conf=0.1, verbose=False)
+workers = [threading.Thread(target=worker) for _ in range(cfg["concurrency"])]
+started = time.perf_counter()
+for w in workers:
+    w.start()
+for w in workers:
+    w.join()
+print(json.dumps({"rps": cfg["concurrency"] * cfg["repeats"] / (time.perf_counter() - started)}))
+"""
+
+
+def _interop_throughput(detector_source, interop_threads, num_threads, concurrency):
+    """Detector requests per second in a child process with the given interop pool size."""
+    cfg = {
+        "detector": detector_source,
+        "interop_threads": interop_threads,
+        "num_threads": num_threads,
+        "concurrency": concurrency,
+        "repeats": AUTOTUNE_REPEATS
+    }
+    proc = subprocess.run(
+        [sys.executable, "-c", AUTOTUNE_INTEROP_SCRIPT, json.dumps(cfg)],
+        capture_output=True, text=True, timeout=AUTOTUNE_INTEROP_TIMEOUT_SECONDS
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])["rps"]
+
+
+def run_autotune():
+    """
+    Benchmark threads per request together with concurrency, interop threads,
+    channels-last and classifier batch size on synthetic input for the active
+    models, then save and apply the best profile for this host type. Thread counts
+    are process-wide, so this holds the inference gate while it runs.
+    """
+    rng = np.random.default_rng(0)
+    frame = Image.fromarray(rng.integers(0, 255, (640, 640, 3), dtype=np.uint8))
+    crops = [
+        Image.fromarray(rng.integers(0, 255, (224, 224, 3), dtype=np.uint8))
+        for _ in range(max(AUTOTUNE_BATCH_SIZES))
+    ]
+    results = {
+        "slots_rps": {}, "slots_latency_ms": {}, "interop_rps": {},
+        "channels_last_ms": {}, "batch_ms_per_crop": {}
+    }
+    with INFERENCE_GATE.hold_all(AUTOTUNE_DRAIN_TIMEOUT_SECONDS):
+        detector = MODEL_REGISTRY.active("detector")
+        classifier = MODEL_REGISTRY.active("classifier")
+        original_threads = torch.get_num_threads()
+
+        def one_request():
+            # Detector + a 4-crop classifier pass, end to end
+            detector.model(frame, conf=0.1, verbose=False)
+            if classifier is not None:
+                _classifier_forward(classifier, crops[:4])
+
+        try:
+            # 1. Threads per request and concurrent requests, measured together under load
+            rps_by_slots, latency_by_slots = {}, {}
+            for threads, concurrency in _slot_candidates():
+                torch.set_num_threads(threads)
+                rps, latency_ms = _throughput(one_request, concurrency)
+                rps_by_slots[threads, concurrency] = rps
+                latency_by_slots[threads, concurrency] = latency_ms
+                results["slots_rps"][f"{threads}x{concurrency}"] = round(rps, 2)
+                results["slots_latency_ms"][f"{threads}x{concurrency}"] = round(latency_ms, 2)
+            best_threads, best_concurrency = _pick_fastest(rps_by_slots, latency_by_slots)
+            torch.set_num_threads(best_threads)
+
+            # 2. Interop pool size, each candidate in its own process
+            interop_threads = INFERENCE_SETTINGS["interop_threads"]
+            candidates = sorted({n for n in AUTOTUNE_INTEROP_CANDIDATES if n <= (os.cpu_count() or 1)} | {1})
+            if len(candidates) > 1:
+                try:
+                    for n in candidates:
+                        results["interop_rps"][n] = round(
+                            _interop_throughput(detector.source, n, best_threads, best_concurrency), 2
+                        )
+                    interop_threads = _pick_fastest(results["interop_rps"], {n: n for n in candidates})  # Fewer threads on ties
+                except (OSError, ValueError, KeyError, RuntimeError, subprocess.SubprocessError) as e:
+                    logger.warning("Interop thread benchmark failed, keeping %s: %s", interop_threads, e)
+                    results["interop_rps"] = {"error": str(e)}
+
+            # 3. Memory layout (only the torch ResNet head exposes it)
+            channels_last = INFERENCE_SETTINGS["channels_last"]
+            if classifier is not None and classifier.backend == "torch":
+                for flag in (False, True):
+                    set_classifier_memory_format(classifier, flag)
+                    results["channels_last_ms"][flag] = round(
+                        _median_ms(lambda: _classifier_forward(classifier, crops[:4], channels_last=flag)), 2
+                    )
+                channels_last = results["channels_last_ms"][True] < results["channels_last_ms"][False] / AUTOTUNE_TOLERANCE
+
+            # 4. Classifier batch size: lowest cost per crop
+            batch_size = INFERENCE_SETTINGS["classifier_batch_size"]
+            if classifier is not None:
+                for b in AUTOTUNE_BATCH_SIZES:
+                    results["batch_ms_per_crop"][b] = round(
+                        _median_ms(lambda: _classifier_forward(classifier, crops[:b], channels_last=channels_last)) / b, 2
+                    )
+                batch_size = min(results["batch_ms_per_crop"], key=results["batch_ms_per_crop"].get)
+        finally:
+            # Leave the live models and settings as they were; the profile is applied below
+            torch.set_num_threads(original_threads)
+            set_classifier_memory_format(classifier, INFERENCE_SETTINGS["channels_last"])
+
+        profile = {
+            "num_threads": best_threads,
+            "inference_concurrency": best_concurrency,
+            "interop_threads": interop_threads,  # Takes effect on the next start
+            "channels_last": channels_last,
+            "classifier_batch_size": batch_size,
+            "models": MODEL_REGISTRY.versions(),
+            "tuned_at": time.time(),
+            "fingerprint": host_fingerprint(),
+            "results": {k: {str(kk): vv for kk, vv in v.items()} for k, v in results.items()}
+        }
+        save_inference_profile(profile)
+        apply_thread_settings(profile)
+        set_classifier_memory_format(classifier, channels_last)
+        INFERENCE_GATE.resize(best_concurrency)
+    return profile
+
+
+def start_autotune():
+    """Run the autotuner on a background thread; returns False if one is already running."""
+    with _autotune_lock:
+        if AUTOTUNE_STATE["running"]:
+            return False
+        AUTOTUNE_STATE["running"] = True
+
+    def work():
+        try:
+            logger.info("Autotuning inference settings...")
+            AUTOTUNE_STATE["profile"] = run_autotune()
+            AUTOTUNE_STATE["last_error"] = None
+            logger.info("Autotune complete", extra={"fields": {"settings": INFERENCE_SETTINGS}})
+        except Exception as e:
+            AUTOTUNE_STATE["last_error"] = str(e)
+            logger.exception("Autotune failed")
+        finally:
+            AUTOTUNE_STATE["running"] = False
+
+    threading.Thread(target=work, name="autotune", daemon=True).start()
+    return True
+
+
+if AUTOTUNE_ON_STARTUP and not SAVED_INFERENCE_PROFILE:
+    start_autotune()
+
 def classify_bird_species(image_path):
-    """Classify bird species using pre-trained ResNet model"""
+    """Classify bird species using the active classifier from the model registry"""
     try:
-        if bird_classifier is None:
-            print("Bird classifier not available, using fallback analysis")
+        classifier = MODEL_REGISTRY.active("classifier")
+        if classifier is None:
+            logger.info("Bird classifier not available, using fallback analysis")
             return fallback_bird_analysis(image_path)
         
         # Load and preprocess image
         image = Image.open(image_path).convert('RGB')
-        image_tensor = transform(image).unsqueeze(0)
         
-        # Get prediction from pre-trained model
-        with torch.no_grad():
-            outputs = bird_classifier(image_tensor)
-            probabilities = F.softmax(outputs, dim=1)
-            top_prob, top_class = torch.topk(probabilities, 5)  # Get top 5 predictions
+        # Get prediction from the active model
+        probabilities = classifier_probabilities(classifier, [image])
+        top_prob, top_class = torch.topk(probabilities, min(5, probabilities.shape[1]))  # Get top 5 predictions
         
         # Get predictions
         predictions = []
-        for i in range(5):
+        for i in range(top_class.shape[1]):
             species_idx = top_class[0][i].item()
             confidence = top_prob[0][i].item()
             
-            if species_idx < len(BIRD_CLASSES):
-                species = BIRD_CLASSES[species_idx]
+            if species_idx < len(classifier.class_names):
+                species = classifier.class_names[species_idx]
                 predictions.append({
                     'species': species,
                     'confidence': confidence,
                     'reason': f"AI model prediction (confidence: {confidence:.3f})"
                 })
         
-        print(f"Pre-trained model predictions: {predictions[:3]}")
+        logger.debug("Pre-trained model predictions: %s", predictions[:3])
         return predictions
         
     except Exception as e:
-        print(f"Error in pre-trained model classification: {e}")
+        logger.error("Error in pre-trained model classification: %s", e)
         return fallback_bird_analysis(image_path)
 
 def fallback_bird_analysis(image_path):
@@ -170,8 +1077,10 @@ def fallback_bird_analysis(image_path):
         green_avg = np.mean(img_array[:, :, 1])
         blue_avg = np.mean(img_array[:, :, 2])
         
-        print(f"Fallback analysis - Size: {width}x{height}, Brightness: {brightness:.1f}")
-        print(f"Color analysis - R:{red_avg:.1f}, G:{green_avg:.1f}, B:{blue_avg:.1f}")
+        logger.debug("Fallback analysis", extra={"fields": {
+            "size": [width, height], "brightness": float(brightness),
+            "rgb": [float(red_avg), float(green_avg), float(blue_avg)]
+        }})
         
         # Simple color-based suggestions
         suggestions = []
@@ -200,7 +1109,7 @@ def fallback_bird_analysis(image_path):
         return suggestions[:3]
         
     except Exception as e:
-        print(f"Error in fallback analysis: {e}")
+        logger.error("Error in fallback analysis: %s", e)
         return None
 
 # --- New helpers for crop/clean, classification over crops, and rich profile ---
@@ -208,9 +1117,43 @@ def fallback_bird_analysis(image_path):
 def _clip(val, lo, hi):
     return max(lo, min(hi, val))
 
-def crop_with_padding(img_path: str, bbox, pad_ratio: float = 0.15) -> Image.Image:
-    """Crop the image around bbox with padding. bbox: [x1,y1,x2,y2] in pixels."""
-    img = Image.open(img_path).convert('RGB')
+# Decode JPEGs no larger than needed: YOLO runs at 640 and crops are resized to
+# 224, so keeping the long side at >= 2x the detector input leaves enough pixels
+# for small birds while letting libjpeg scale down by 1/2, 1/4 or 1/8 in the DCT domain.
+INGEST_MIN_LONG_SIDE = 1280
+
+def decode_for_inference(data: bytes, min_long_side: int = INGEST_MIN_LONG_SIDE):
+    """
+    Decode uploaded bytes to RGB, using JPEG draft mode to decode at a reduced scale.
+    Returns (image, image_format, original_size, scale) where scale=(sx, sy) maps
+    decoded pixel coordinates back to the original image. EXIF orientation is
+    applied, so sizes and coordinates are those of the upright image.
+    """
+    img = Image.open(io.BytesIO(data))
+    image_format = img.format
+    orig_w, orig_h = img.size
+    long_side = max(orig_w, orig_h)
+    if image_format == "JPEG" and long_side > min_long_side:
+        ratio = min_long_side / float(long_side)
+        # draft() picks the smallest DCT scale that still covers the requested size
+        img.draft('RGB', (int(np.ceil(orig_w * ratio)), int(np.ceil(orig_h * ratio))))
+    # Orientations 5-8 are 90/270 degree rotations, which swap width and height
+    if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        orig_w, orig_h = orig_h, orig_w
+    img = ImageOps.exif_transpose(img).convert('RGB')
+    scale = (orig_w / float(img.size[0]), orig_h / float(img.size[1]))
+    return img, image_format, (orig_w, orig_h), scale
+
+def scale_bbox(bbox, scale):
+    """Map [x1,y1,x2,y2] between decoded and original coordinates (scale=(sx, sy))."""
+    sx, sy = scale
+    x1, y1, x2, y2 = map(float, bbox)
+    return [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+
+def crop_with_padding(img, bbox, pad_ratio: float = 0.15) -> Image.Image:
+    """Crop the image (PIL image or path) around bbox with padding. bbox: [x1,y1,x2,y2] in pixels."""
+    if isinstance(img, str):
+        img = Image.open(img).convert('RGB')
     w, h = img.size
     x1, y1, x2, y2 = map(float, bbox)
     bw, bh = x2 - x1, y2 - y1
@@ -222,34 +1165,99 @@ def crop_with_padding(img_path: str, bbox, pad_ratio: float = 0.15) -> Image.Ima
     ny2 = int(_clip(y2 + py, 1, h))
     return img.crop((nx1, ny1, nx2, ny2))
 
-def classify_topk_on_crops(crops: list[Image.Image], top_k: int = 5):
+def classify_topk_on_crops(crops: list[Image.Image], top_k: int = 5, classifier=None):
     """Run classifier on multiple crops, return best species and top-k alternatives with confidences."""
-    predictions = []
-    if bird_classifier is None:
+    if classifier is None:
+        classifier = MODEL_REGISTRY.active("classifier")
+    if classifier is None:
         # Fallback: use color-based analysis on the largest crop
         if not crops:
             return [], []
         return fallback_bird_analysis_for_crops(crops), []
 
-    tensors = []
-    for c in crops[:6]:  # limit crops for latency
-        tensors.append(transform(c).unsqueeze(0))
-    if not tensors:
+    crops = crops[:MAX_CROPS]  # limit crops for latency
+    if not crops:
         return [], []
-    batch = torch.cat(tensors, dim=0)
-    with torch.no_grad():
-        logits = bird_classifier(batch)
-        probs = F.softmax(logits, dim=1)
-        # Aggregate by taking max probability across crops per class
-        agg = torch.max(probs, dim=0).values  # [num_classes]
-        top_prob, top_idx = torch.topk(agg, k=min(top_k, agg.shape[0]))
+    probs = classifier_probabilities(classifier, crops)
+    # Aggregate by taking max probability across crops per class
+    agg = torch.max(probs, dim=0).values  # [num_classes]
+    top_prob, top_idx = torch.topk(agg, k=min(top_k, agg.shape[0]))
     top = []
     for p, idx in zip(top_prob.tolist(), top_idx.tolist()):
-        if idx < len(BIRD_CLASSES):
-            top.append({"species": BIRD_CLASSES[idx], "confidence": p})
+        if idx < len(classifier.class_names):
+            top.append({"species": classifier.class_names[idx], "confidence": p})
     best = top[0] if top else None
     return best, top
 
+def classify_each_crop(crops: list[Image.Image], top_k: int = 3, classifier=None):
+    """Classify every crop on its own; returns one top-k list per crop, in input order."""
+    if classifier is None:
+        classifier = MODEL_REGISTRY.active("classifier")
+    if not crops:
+        return []
+    if classifier is None:
+        return [[fallback_bird_analysis_for_crops([crop])] for crop in crops]
+    # classifier_probabilities runs fixed-size chunks, so memory stays bounded for large flocks
+    probs = classifier_probabilities(classifier, crops)
+    top_prob, top_idx = torch.topk(probs, k=min(top_k, probs.shape[1]), dim=1)
+    per_crop = []
+    for row_prob, row_idx in zip(top_prob.tolist(), top_idx.tolist()):
+        per_crop.append([
+            {"species": classifier.class_names[idx], "confidence": p}
+            for p, idx in zip(row_prob, row_idx) if idx < len(classifier.class_names)
+        ])
+    return per_crop
+
+
+DETECTION_MERGE_IOU = 0.6  # Bird boxes overlapping at least this much are treated as one bird
+
+
+def box_area(bbox):
+    return max(0.0, bbox[2] - bbox[0]) * max(0.0, bbox[3] - bbox[1])
+
+
+def box_iou(a, b):
+    inter = box_area([max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])])
+    union = box_area(a) + box_area(b) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def merge_overlapping_detections(detections, iou_threshold=DETECTION_MERGE_IOU):
+    """
+    Greedy NMS: keep the most confident box of each overlapping group and
+    record how many duplicates it absorbed in 'merged'.
+    """
+    kept = []
+    for det in sorted(detections, key=lambda d: d.get('confidence', 0.0), reverse=True):
+        bbox = det.get('bbox')
+        duplicate_of = None
+        if bbox and len(bbox) == 4:
+            for k in kept:
+                if box_iou(bbox, k['bbox']) >= iou_threshold:
+                    duplicate_of = k
+                    break
+        if duplicate_of is not None:
+            duplicate_of['merged'] = duplicate_of.get('merged', 0) + 1
+        else:
+            kept.append(dict(det))
+    return kept
+
+
+def rank_detections(detections, image_size):
+    """
+    Order detections by confidence weighted by relative box size, so large,
+    confident birds are classified first and tiny, uncertain ones are dropped
+    first when the crop limit bites.
+    """
+    image_area = float(image_size[0] * image_size[1]) or 1.0
+
+    def priority(det):
+        bbox = det.get('bbox')
+        area = box_area(bbox) if bbox and len(bbox) == 4 else 0.0
+        return det.get('confidence', 0.0) * math.sqrt(area / image_area)
+
+    return sorted(detections, key=priority, reverse=True)
+
 def fallback_bird_analysis_for_crops(crops: list[Image.Image]):
     # Use the largest crop
     img = max(crops, key=lambda im: im.size[0]*im.size[1])
@@ -269,10 +1277,14 @@ def fallback_bird_analysis_for_crops(crops: list[Image.Image]):
         suggestions = [{"species": "American Robin", "confidence": 0.4}]
     return suggestions[0]
 
-def build_rich_profile(species_common: str, species_conf: float, alternatives: list):
+def build_rich_profile(species_common: str, species_conf: float, alternatives: list, budget=None):
     """Build a 20+ field profile by enriching with eBird and adding structured fields."""
-    # Try API, then fallback KB for robust defaults
-    base = get_bird_details_from_api(species_common) or FALLBACK_KB.get(species_common, {})
+    # Try API (within the request budget), then fallback KB for robust defaults
+    if budget is None:
+        base = get_bird_details_from_api(species_common)
+    else:
+        base = get_enrichment_within_budget(species_common, budget)
+    base = base or FALLBACK_KB.get(species_common, {})
     common_name = base.get("common_name") or species_common
     sci = base.get("scientific_name", "")
     family = base.get("family", "")
@@ -332,12 +1344,597 @@ COCO_CLASSES = [
 ]
 
 # Simple in-memory cache for eBird taxonomy
-TAXONOMY_CACHE = {"data": None, "fetched_at": 0.0}
+TAXONOMY_CACHE = {"data": None, "fetched_at": 0.0, "version": None, "modified_at": None}
 CACHE_TTL_SECONDS = 24 * 60 * 60  # 24 hours
 
+# Default connect/read timeouts for eBird calls
+EBIRD_TIMEOUT = (3, 5)
+
+# --- Shared eBird HTTP client ---
+# One keep-alive session for every eBird call, bounded retries with full
+# jitter, and a circuit breaker that fails fast while eBird is unhealthy
+# instead of making every request wait out its timeout.
+EBIRD_BASE_URL = "https://api.ebird.org/v2"
+EBIRD_POOL_SIZE = 16  # Keep-alive connections kept open to api.ebird.org
+EBIRD_MAX_RETRIES = 2
+EBIRD_RETRY_BASE_SECONDS = 0.1
+EBIRD_RETRY_MAX_SECONDS = 1.0
+EBIRD_RETRY_STATUSES = {429, 500, 502, 503, 504}
+EBIRD_BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failures before the breaker opens
+EBIRD_BREAKER_COOLDOWN_SECONDS = 30
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling eBird while the circuit breaker is open."""
+
+
+# Transport errors worth retrying; other RequestExceptions count as failures but are raised at once
+EBIRD_RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def clamp_timeout(timeout, remaining):
+    """
+    Shrink a requests timeout (seconds, or a (connect, read) tuple) so connect +
+    read fit in the remaining seconds. None when there is no time left.
+    """
+    if remaining <= 0:
+        return None
+    if isinstance(timeout, tuple):
+        total = sum(timeout)
+        if total <= remaining:
+            return timeout
+        factor = remaining / total
+        return tuple(t * factor for t in timeout)
+    return min(timeout, remaining)
+
+
+class EbirdClient:
+    """Pooled, retrying, circuit-broken client for the eBird API."""
+
+    def __init__(self, api_key, pool_size=EBIRD_POOL_SIZE):
+        self.session = requests.Session()
+        self.session.headers.update({"X-eBirdApiToken": api_key})
+        self.adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._half_open_trial = False
+        self.metrics = {"requests": 0, "failures": 0, "retries": 0, "short_circuited": 0, "total_ms": 0.0}
+
+    # Circuit breaker
+    def _allow_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if (time.monotonic() - self._opened_at) < EBIRD_BREAKER_COOLDOWN_SECONDS or self._half_open_trial:
+                self.metrics["short_circuited"] += 1
+                return False
+            # Half-open: let a single trial request through
+            self._half_open_trial = True
+            return True
+
+    def _record(self, ok, elapsed_ms):
+        with self._lock:
+            self.metrics["requests"] += 1
+            self.metrics["total_ms"] += elapsed_ms
+            self._half_open_trial = False
+            if ok:
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self.metrics["failures"] += 1
+            self._consecutive_failures += 1
+            if self._opened_at is not None or self._consecutive_failures >= EBIRD_BREAKER_FAILURE_THRESHOLD:
+                if self._opened_at is None:
+                    logger.warning("eBird circuit breaker opened after %d failures", self._consecutive_failures)
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if (time.monotonic() - self._opened_at) < EBIRD_BREAKER_COOLDOWN_SECONDS:
+                return "open"
+            return "half-open"
+
+    def get(self, path, params=None, timeout=EBIRD_TIMEOUT, deadline=None):
+        """
+        GET {EBIRD_BASE_URL}{path}. Retries connection errors, timeouts and 429/5xx,
+        but never past the caller's (connect + read) timeout in total, nor past
+        deadline (an absolute time.monotonic() value) when one is given.
+        """
+        give_up_at = time.monotonic() + (sum(timeout) if isinstance(timeout, tuple) else timeout)
+        if deadline is not None:
+            give_up_at = min(give_up_at, deadline)
+        attempt = 0
+        error = None
+        response = None
+        while True:
+            attempt_timeout = clamp_timeout(timeout, give_up_at - time.monotonic())
+            if attempt_timeout is None:
+                # Out of time before this attempt could start
+                if error is not None:
+                    raise error
+                if response is not None:
+                    return response
+                raise requests.Timeout(f"No time left for eBird request {path}")
+            if not self._allow_request():
+                raise CircuitOpenError(f"eBird circuit open; skipping {path}")
+            started = time.monotonic()
+            error = None
+            response = None
+            try:
+                response = self.session.get(EBIRD_BASE_URL + path, params=params, timeout=attempt_timeout)
+            except requests.RequestException as e:
+                error = e
+            except Exception:
+                # Every attempt must settle the breaker, or a failed half-open trial wedges it open
+                self._record(False, (time.monotonic() - started) * 1000.0)
+                raise
+            failed = error is not None or response.status_code in EBIRD_RETRY_STATUSES
+            self._record(not failed, (time.monotonic() - started) * 1000.0)
+            if not failed:
+                return response
+            if error is not None and not isinstance(error, EBIRD_RETRY_ERRORS):
+                raise error
+
+            backoff = random.uniform(0, min(EBIRD_RETRY_MAX_SECONDS, EBIRD_RETRY_BASE_SECONDS * (2 ** attempt)))
+            out_of_time = time.monotonic() + backoff >= give_up_at
+            if attempt >= EBIRD_MAX_RETRIES or out_of_time or self.state == "open":
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            with self._lock:
+                self.metrics["retries"] += 1
+            time.sleep(backoff)
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+        total_ms = metrics.pop("total_ms")
+        metrics["avg_ms"] = round(total_ms / metrics["requests"], 1) if metrics["requests"] else 0.0
+        metrics["breaker"] = self.state
+        pools = []
+        try:
+            for pool in list(self.adapter.poolmanager.pools._container.values()):
+                pools.append({
+                    "host": pool.host,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle": pool.pool.qsize() if pool.pool is not None else 0
+                })
+        except Exception as e:
+            logger.warning("Error reading eBird pool stats: %s", e)
+        metrics["pools"] = pools
+        return metrics
+
+
+EBIRD_CLIENT = EbirdClient(EBIRD_API_KEY)
+
+# --- Per-request latency budgets ---
+# Clients may send a deadline (X-Deadline-Ms header or deadline_ms field) and
+# each stage of the pipeline trims its work to fit what is left of it.
+MAX_DEADLINE_MS = 60 * 1000
+BUDGET_CONNECT_SHARE = 0.3  # Share of a budgeted upstream call's time allowed for connecting
+MAX_CROPS = 6  # Upper bound on crops classified per request
+PER_BIRD_MAX_CROPS = 32  # Upper bound in per-bird mode, keeping CPU cost predictable for flocks
+EST_CROP_MS = 120  # Rough CPU cost of classifying one crop
+MIN_ENRICHMENT_MS = 400  # Below this, skip live eBird enrichment
+MIN_OCCURRENCES_MS = 200  # Below this, skip the recent-sightings call
+
+# Last good enrichment per species, served stale when the budget runs out
+ENRICHMENT_CACHE = {}
+ENRICHMENT_CACHE_TTL_SECONDS = 15 * 60  # 15 minutes
+
+
+class RequestBudget:
+    """Tracks a request deadline and records which parts of the response were degraded."""
+
+    def __init__(self, deadline_ms=None, started=None):
+        # started lets time spent queued for admission count against the deadline
+        self.started = started if started is not None else time.monotonic()
+        self.deadline_ms = deadline_ms
+        self.degraded = {}
+
+    def elapsed_ms(self):
+        return (time.monotonic() - self.started) * 1000.0
+
+    def remaining_ms(self):
+        """Milliseconds left before the deadline, or None when there is no deadline."""
+        if self.deadline_ms is None:
+            return None
+        return max(0.0, self.deadline_ms - self.elapsed_ms())
+
+    def has(self, ms):
+        remaining = self.remaining_ms()
+        return remaining is None or remaining >= ms
+
+    def deadline(self):
+        """Absolute time.monotonic() deadline, or None when there is no deadline."""
+        if self.deadline_ms is None:
+            return None
+        return self.started + self.deadline_ms / 1000.0
+
+    def timeout(self, default=EBIRD_TIMEOUT):
+        """
+        Split the time left between connect and read so one upstream call, connect
+        plus read, fits before the deadline. Pass deadline() along as well so the
+        client's retries cannot outlive it either.
+        """
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return default
+        seconds = max(remaining / 1000.0, 0.001)
+        if seconds >= sum(default):
+            return default
+        connect = min(default[0], seconds * BUDGET_CONNECT_SHARE)
+        return (connect, seconds - connect)
+
+    def crop_limit(self, available, cap=MAX_CROPS):
+        """How many crops we can afford to classify; always at least one."""
+        limit = min(available, cap)
+        remaining = self.remaining_ms()
+        if remaining is not None:
+            limit = min(limit, max(1, int(remaining // EST_CROP_MS)))
+        return limit
+
+    def degrade(self, part, reason):
+        self.degraded[part] = reason
+
+    def summary(self):
+        return {
+            "deadline_ms": self.deadline_ms,
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "degraded": bool(self.degraded)
+        }
+
+
+def parse_deadline_ms(req, include_form=True):
+    """Read the client deadline from the X-Deadline-Ms header or a deadline_ms field."""
+    fields = req.values if include_form else req.args
+    raw = req.headers.get('X-Deadline-Ms') or fields.get('deadline_ms')
+    if not raw:
+        return None
+    try:
+        deadline = int(float(raw))
+    except (TypeError, ValueError):
+        return None
+    if deadline <= 0:
+        return None
+    return min(deadline, MAX_DEADLINE_MS)
+
+
+# --- Admission control for inference ---
+# CPU-bound inference runs at most INFERENCE_MAX_CONCURRENCY at a time with a
+# short bounded wait queue behind it. Anything beyond that is rejected at once
+# with 503 + Retry-After before the upload body is even read, so server
+# threads stay free for /health, /search-bird and /suggest-bird, which never
+# queue here. Size the server's thread pool above concurrency + queue length.
+INFERENCE_MAX_CONCURRENCY = int(
+    (SAVED_INFERENCE_PROFILE or {}).get("inference_concurrency") or max(1, (os.cpu_count() or 2) // 2)
+)  # The autotuner picks this together with threads per request (see run_autotune)
+INFERENCE_MAX_QUEUE = 8
+INFERENCE_QUEUE_TIMEOUT_SECONDS = 10
+INFERENCE_POLL_SECONDS = 0.1  # How often queued requests check for client disconnects
+
+
+def client_disconnected(environ):
+    """Best-effort check whether the client has closed its connection."""
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    if sock is None or isinstance(sock, ssl.SSLSocket):
+        return False  # SSL sockets reject recv flags, so TLS connections are never reported closed
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, InterruptedError, ValueError):
+        return False  # Connected, nothing buffered (or a socket type that cannot be peeked)
+    except OSError:
+        return True
+
+
+class InferenceGate:
+    """Concurrency limit plus bounded wait queue for inference requests."""
+
+    def __init__(self, max_concurrency, max_queue):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # Notified whenever a slot frees up or the limit changes
+        self._exclusive = False  # Set by hold_all: nothing new is admitted
+        self.running = 0
+        self.waiting = 0
+        self.avg_seconds = 1.0  # EWMA of time holding a slot, used for Retry-After
+        self.stats_counts = {"admitted": 0, "rejected": 0, "timed_out": 0, "cancelled": 0}
+
+    def retry_after(self):
+        with self._lock:
+            backlog = self.running + self.waiting
+            return max(1, math.ceil(self.avg_seconds * backlog / self.max_concurrency))
+
+    def enter(self, environ, max_wait):
+        """Returns None when admitted, else the reason ('queue_full', 'timeout', 'disconnected')."""
+        give_up_at = time.monotonic() + max_wait
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.stats_counts["rejected"] += 1
+                return "queue_full"
+            self.waiting += 1
+            try:
+                while True:
+                    if not self._exclusive and self.running < self.max_concurrency:
+                        self.running += 1
+                        self.stats_counts["admitted"] += 1
+                        return None
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        self.stats_counts["timed_out"] += 1
+                        return "timeout"
+                    self._changed.wait(min(INFERENCE_POLL_SECONDS, remaining))
+                    if client_disconnected(environ):
+                        self.stats_counts["cancelled"] += 1
+                        return "disconnected"
+            finally:
+                self.waiting -= 1
+
+    def leave(self, held_seconds):
+        with self._lock:
+            self.running -= 1
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * held_seconds
+            self._changed.notify_all()
+
+    def record_cancel(self):
+        with self._lock:
+            self.stats_counts["cancelled"] += 1
+
+    def resize(self, max_concurrency):
+        """Change the concurrency limit; requests already running finish normally."""
+        with self._lock:
+            self.max_concurrency = max(1, int(max_concurrency))
+            self._changed.notify_all()
+
+    @contextmanager
+    def hold_all(self, timeout):
+        """Stop admitting and wait for in-flight requests so nothing else runs inference."""
+        give_up_at = time.monotonic() + timeout
+        with self._lock:
+            if self._exclusive:
+                raise RuntimeError("Inference is already held")
+            self._exclusive = True
+            try:
+                while self.running:
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        raise RuntimeError("Timed out waiting for in-flight inference to finish")
+                    self._changed.wait(remaining)
+            except BaseException:
+                self._exclusive = False
+                self._changed.notify_all()
+                raise
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._exclusive = False
+                self._changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.stats_counts,
+                running=self.running,
+                waiting=self.waiting,
+                max_concurrency=self.max_concurrency,
+                max_queue=self.max_queue,
+                held=self._exclusive,
+                avg_seconds=round(self.avg_seconds, 3)
+            )
+
+
+INFERENCE_GATE = InferenceGate(INFERENCE_MAX_CONCURRENCY, INFERENCE_MAX_QUEUE)
+
+
+def server_busy_response():
+    retry_after = INFERENCE_GATE.retry_after()
+    resp = jsonify({
+        'message': 'Server is busy identifying other photos. Please retry shortly.',
+        'retry_after': retry_after
+    })
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(retry_after)
+    return resp
+
+
+def client_closed_response():
+    # Nobody is listening; 499 (client closed request) keeps it visible in logs
+    return jsonify({'message': 'Client closed request'}), 499
+
+
+def admission_controlled(view):
+    """Gate an inference route through INFERENCE_GATE; OPTIONS passes straight through."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return view(*args, **kwargs)
+        g.request_started = time.monotonic()
+        deadline_ms = parse_deadline_ms(request, include_form=False)  # don't read the body yet
+        max_wait = INFERENCE_QUEUE_TIMEOUT_SECONDS
+        if deadline_ms is not None:
+            max_wait = min(max_wait, deadline_ms / 1000.0)
+        reason = INFERENCE_GATE.enter(request.environ, max_wait)
+        if reason == "disconnected":
+            return client_closed_response()
+        if reason is not None:
+            return server_busy_response()
+        admitted_at = time.monotonic()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            INFERENCE_GATE.leave(time.monotonic() - admitted_at)
+    return wrapper
+
+
+def get_enrichment_within_budget(species_name, budget):
+    """
+    eBird enrichment that respects the request budget: fresh cache first, then a
+    live lookup if there is time, else stale cache, else None (caller uses FALLBACK_KB).
+    """
+    key = species_name.lower()
+    cached = ENRICHMENT_CACHE.get(key)
+    if cached and (time.time() - cached["fetched_at"]) < ENRICHMENT_CACHE_TTL_SECONDS:
+        return cached["data"]
+
+    if not budget.has(MIN_ENRICHMENT_MS):
+        if cached:
+            budget.degrade("enrichment", "stale")
+            return cached["data"]
+        budget.degrade("enrichment", "fallback")
+        return None
 
-def get_cached_taxonomy():
-    """Fetch and cache the eBird taxonomy to avoid repeated large downloads."""
+    details = get_bird_details_from_api(species_name, budget=budget)
+    if details and details.get("scientific_name"):
+        if "occurrences" not in budget.degraded:
+            ENRICHMENT_CACHE[key] = {"data": details, "fetched_at": time.time()}
+        return details
+
+    # Live lookup came back empty: upstream failure, or a name eBird does not know
+    if cached:
+        budget.degrade("enrichment", "stale")
+        return cached["data"]
+    if TAXONOMY_CACHE["data"] is None or not budget.has(1):
+        budget.degrade("enrichment", "fallback")
+    # None (not the empty details dict) so build_rich_profile falls back to FALLBACK_KB
+    return None
+
+
+# --- Compact columnar eBird taxonomy ---
+# Instead of ~17k dicts, each string field is stored as one newline-joined str
+# plus an array of row offsets, and low-cardinality fields (family, order,
+# category) are dictionary-encoded. A handful of large objects keeps memory
+# small and, when loaded before workers fork, the pages stay shared because
+# lookups never touch per-row refcounts.
+PRELOAD_TAXONOMY = False  # Fetch at import so pre-fork servers share one copy
+
+
+class _StringColumn:
+    """Strings packed into one newline-delimited str with integer start offsets."""
+
+    def __init__(self, values):
+        values = [(v or "").replace("\n", " ") for v in values]
+        self.text = "\n" + "\n".join(values) + "\n"
+        self.starts = array('I')
+        pos = 1
+        for v in values:
+            self.starts.append(pos)
+            pos += len(v) + 1
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        start = self.starts[i]
+        return self.text[start:self.text.index("\n", start)]
+
+    def row_at(self, pos):
+        return bisect_right(self.starts, pos) - 1
+
+    def find_exact(self, value):
+        """Index of the first row equal to value, or None."""
+        if "\n" in value:
+            return None
+        pos = self.text.find("\n" + value + "\n")
+        return self.row_at(pos + 1) if pos >= 0 else None
+
+    def find_substring(self, value):
+        """Index of the first row containing value, or None."""
+        if not value:
+            return 0 if len(self) else None
+        if "\n" in value:
+            return None
+        pos = self.text.find(value)
+        return self.row_at(pos) if pos >= 0 else None
+
+
+class _CategoryColumn:
+    """Dictionary-encoded column for fields with few distinct values."""
+
+    def __init__(self, values):
+        self.values = []
+        lookup = {}
+        self.codes = array('H')
+        for v in values:
+            v = sys.intern(v or "")
+            if v not in lookup:
+                lookup[v] = len(self.values)
+                self.values.append(v)
+            self.codes.append(lookup[v])
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+
+class CompactTaxonomy:
+    """Columnar view of the eBird taxonomy; record(i) rebuilds the original dict."""
+
+    STRING_FIELDS = ("speciesCode", "comName", "sciName")
+    CATEGORY_FIELDS = ("category", "order", "familyCode", "familyComName", "familySciName")
+    LIST_FIELDS = ("bandingCodes", "comNameCodes", "sciNameCodes")
+    LIST_SEPARATOR = ","
+
+    def __init__(self, records):
+        self.columns = {}
+        for field in self.STRING_FIELDS:
+            self.columns[field] = _StringColumn([r.get(field, "") for r in records])
+        for field in self.CATEGORY_FIELDS:
+            self.columns[field] = _CategoryColumn([r.get(field, "") for r in records])
+        for field in self.LIST_FIELDS:
+            self.columns[field] = _StringColumn([self.LIST_SEPARATOR.join(r.get(field) or []) for r in records])
+        self.taxon_order = array('d', [float(r.get("taxonOrder") or 0.0) for r in records])
+        # Lowercased copies drive the case-insensitive lookups
+        self.com_lower = _StringColumn([(r.get("comName") or "").lower() for r in records])
+        self.sci_lower = _StringColumn([(r.get("sciName") or "").lower() for r in records])
+        # Anything else (reportAs, extinct, extinctYear, ...) is rare: keep it sparse, per row
+        known = set(self.STRING_FIELDS + self.CATEGORY_FIELDS + self.LIST_FIELDS) | {"taxonOrder"}
+        self.extras = {}
+        for i, r in enumerate(records):
+            extra = {k: v for k, v in r.items() if k not in known}
+            if extra:
+                self.extras[i] = extra
+
+    @classmethod
+    def from_json_bytes(cls, payload):
+        records = orjson.loads(payload) if orjson is not None else json.loads(payload)
+        return cls(records)
+
+    def __len__(self):
+        return len(self.taxon_order)
+
+    def record(self, i):
+        rec = {field: self.columns[field][i] for field in self.STRING_FIELDS + self.CATEGORY_FIELDS}
+        for field in self.LIST_FIELDS:
+            packed = self.columns[field][i]
+            rec[field] = packed.split(self.LIST_SEPARATOR) if packed else []
+        rec["taxonOrder"] = self.taxon_order[i]
+        rec.update(self.extras.get(i, ()))
+        return rec
+
+    def find(self, name):
+        """Same precedence as the old linear scans: exact common, exact scientific, partial common, partial scientific."""
+        q = name.lower()
+        for idx in (
+            self.com_lower.find_exact(q),
+            self.sci_lower.find_exact(q),
+            self.com_lower.find_substring(q),
+            self.sci_lower.find_substring(q),
+        ):
+            if idx is not None:
+                return idx
+        return None
+
+
+def get_cached_taxonomy(timeout=EBIRD_TIMEOUT, deadline=None):
+    """Fetch and cache the eBird taxonomy (as a CompactTaxonomy) to avoid repeated large downloads."""
     now = time.time()
     if (
         TAXONOMY_CACHE["data"] is not None
@@ -346,77 +1943,472 @@ def get_cached_taxonomy():
         return TAXONOMY_CACHE["data"]
 
     try:
-        url = "https://api.ebird.org/v2/ref/taxonomy/ebird"
-        headers = {"X-eBirdApiToken": EBIRD_API_KEY}
-        params = {"fmt": "json"}
         # Use separate connect/read timeouts to avoid long hangs
-        response = requests.get(url, headers=headers, params=params, timeout=(3, 5))
+        response = EBIRD_CLIENT.get("/ref/taxonomy/ebird", params={"fmt": "json"}, timeout=timeout, deadline=deadline)
         response.raise_for_status()
-        TAXONOMY_CACHE["data"] = response.json()
+        version = hashlib.sha256(response.content).hexdigest()[:16]
+        if version != TAXONOMY_CACHE["version"]:
+            TAXONOMY_CACHE["data"] = CompactTaxonomy.from_json_bytes(response.content)
+            TAXONOMY_CACHE["version"] = version
+            TAXONOMY_CACHE["modified_at"] = now
         TAXONOMY_CACHE["fetched_at"] = now
         return TAXONOMY_CACHE["data"]
     except Exception as e:
-        print(f"Error fetching eBird taxonomy: {e}")
+        logger.warning("Error fetching eBird taxonomy: %s", e)
         # Serve stale cache if available
         if TAXONOMY_CACHE["data"] is not None:
             return TAXONOMY_CACHE["data"]
         return None
 
-def get_ebird_species_info(species_name):
+def get_ebird_species_info(species_name, timeout=EBIRD_TIMEOUT, deadline=None):
     """
     Query eBird taxonomy and return species info matching common name or scientific name.
     """
     try:
-        species_list = get_cached_taxonomy()
-        if not species_list:
+        taxonomy = get_cached_taxonomy(timeout=timeout, deadline=deadline)
+        if not taxonomy:
             return None
 
-        # Search for exact match first (common name)
-        for sp in species_list:
-            if sp.get("comName", "").lower() == species_name.lower():
-                return sp
+        idx = taxonomy.find(species_name)
+        return taxonomy.record(idx) if idx is not None else None
+    except Exception as e:
+        logger.warning("Error fetching eBird data: %s", e)
+        return None
 
-        # Search for exact scientific name match
-        for sp in species_list:
-            if sp.get("sciName", "").lower() == species_name.lower():
-                return sp
+if PRELOAD_TAXONOMY:
+    get_cached_taxonomy()
 
-        # Search for partial matches in common name
-        for sp in species_list:
-            if species_name.lower() in sp.get("comName", "").lower():
-                return sp
+# --- Species name suggestions (autocomplete) ---
+# Word-prefix lookups use a sorted token array (a flattened prefix trie:
+# every completion of a prefix is one contiguous bisect range) and typo
+# tolerance comes from a trigram index scored with numpy, so each keystroke
+# costs well under a millisecond once the index is built.
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 25
+SUGGEST_MIN_SIMILARITY = 0.2
+SUGGEST_RESULT_CACHE_SIZE = 2048
 
-        # Search for partial matches in scientific name
-        for sp in species_list:
-            if species_name.lower() in sp.get("sciName", "").lower():
-                return sp
+_NON_WORD_RE = re.compile(r"[^0-9a-z]+")
 
-        return None
+
+def normalize_name(text):
+    """Lowercase, fold punctuation (hyphens, apostrophes) to spaces and collapse whitespace."""
+    return " ".join(_NON_WORD_RE.sub(" ", (text or "").lower()).split())
+
+
+def _trigrams(norm):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SpeciesSuggestIndex:
+    """Ranked prefix + trigram search over eBird names and BIRD_CLASSES."""
+
+    def __init__(self, taxonomy=None):
+        self.taxonomy = taxonomy
+        self.names = []       # display name
+        self.kinds = []       # "common" | "scientific" | "model"
+        self.commons = []     # common name for the entry
+        self.scientifics = []
+        self.codes = []
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+        seen_common = set()
+        if taxonomy is not None:
+            com_col = taxonomy.columns["comName"]
+            sci_col = taxonomy.columns["sciName"]
+            code_col = taxonomy.columns["speciesCode"]
+            for i in range(len(taxonomy)):
+                com, sci, code = com_col[i], sci_col[i], code_col[i]
+                self._add(com, "common", com, sci, code)
+                self._add(sci, "scientific", com, sci, code)
+                seen_common.add(normalize_name(com))
+        for name in dict.fromkeys(BIRD_CLASSES):
+            if normalize_name(name) not in seen_common:
+                self._add(name, "model", name, FALLBACK_KB.get(name, {}).get("scientific_name", ""), "")
+
+        norms = [normalize_name(n) for n in self.names]
+        self.lengths = np.array([len(n) for n in norms], dtype=np.int32)
+
+        # Sorted (token, entry, position) triples for word-prefix ranges
+        triples = sorted(
+            (tok, idx, pos)
+            for idx, norm in enumerate(norms)
+            for pos, tok in enumerate(norm.split())
+        )
+        self.tokens = [t[0] for t in triples]
+        self.token_entries = np.array([t[1] for t in triples], dtype=np.int32)
+        self.token_positions = np.array([t[2] for t in triples], dtype=np.int16)
+
+        postings = {}
+        tri_counts = np.zeros(len(norms), dtype=np.int16)
+        for idx, norm in enumerate(norms):
+            grams = _trigrams(norm)
+            tri_counts[idx] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(idx)
+        self.trigram_postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.trigram_counts = tri_counts
+
+    def _add(self, name, kind, common, scientific, code):
+        if not name:
+            return
+        self.names.append(name)
+        self.kinds.append(kind)
+        self.commons.append(common)
+        self.scientifics.append(scientific)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_entries(self, prefix):
+        lo = bisect_left(self.tokens, prefix)
+        hi = bisect_left(self.tokens, prefix + "\uffff")
+        return lo, hi
+
+    def _prefix_scores(self, q_tokens):
+        """Entries where every query token prefixes some name token; higher score is better."""
+        lo, hi = self._prefix_entries(q_tokens[0])
+        if lo == hi:
+            return None, None
+        candidates = self.token_entries[lo:hi]
+        starts = self.token_positions[lo:hi] == 0
+        if len(q_tokens) > 1:
+            first_word = candidates[starts]
+            candidates = np.unique(candidates)
+            for tok in q_tokens[1:]:
+                lo, hi = self._prefix_entries(tok)
+                if lo == hi:
+                    return None, None
+                candidates = np.intersect1d(candidates, self.token_entries[lo:hi])
+                if candidates.size == 0:
+                    return None, None
+            starts = np.isin(candidates, first_word)
+        # Name starts with the query > word-prefix match anywhere; shorter names first.
+        # A single-token query may list an entry twice; suggest() drops the repeat.
+        scores = 2.0 + starts - self.lengths[candidates] / 1000.0
+        return candidates, scores
+
+    def _trigram_scores(self, norm):
+        grams = [gram for gram in _trigrams(norm) if gram in self.trigram_postings]
+        if not grams:
+            return None, None
+        hits = np.bincount(
+            np.concatenate([self.trigram_postings[gram] for gram in grams]),
+            minlength=len(self.names)
+        )
+        candidates = np.nonzero(hits)[0]
+        shared = hits[candidates]
+        # Jaccard similarity between the trigram sets
+        sim = shared / (len(_trigrams(norm)) + self.trigram_counts[candidates] - shared)
+        keep = sim >= SUGGEST_MIN_SIMILARITY
+        return candidates[keep], sim[keep]
+
+    @staticmethod
+    def _top_order(score, limit):
+        """Indices of score, best first; only the head is fully sorted for large candidate sets."""
+        head = limit * 4  # room for entries that collapse into one species
+        if score.size > head:
+            top = np.argpartition(-score, head)[:head]
+            top = top[np.argsort(-score[top], kind="stable")]
+            rest = np.setdiff1d(np.arange(score.size), top, assume_unique=True)
+            yield from top
+            yield from rest[np.argsort(-score[rest], kind="stable")]
+        else:
+            yield from np.argsort(-score, kind="stable")
+
+    def suggest(self, query, limit=SUGGEST_DEFAULT_LIMIT):
+        norm = normalize_name(query)
+        if not norm:
+            return []
+        key = (norm, limit)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        ranked = []
+        candidates, scores = self._prefix_scores(norm.split())
+        if candidates is not None:
+            ranked.append((candidates, scores, "prefix"))
+        if candidates is None or candidates.size < limit:
+            fuzzy, sims = self._trigram_scores(norm)
+            if fuzzy is not None and fuzzy.size:
+                ranked.append((fuzzy, sims, "fuzzy"))
+
+        results = []
+        seen = set()
+        for cand, score, match in ranked:
+            for j in self._top_order(score, limit):
+                idx = int(cand[j])
+                species_key = self.codes[idx] or normalize_name(self.commons[idx])
+                if species_key in seen:
+                    continue
+                seen.add(species_key)
+                results.append({
+                    "name": self.names[idx],
+                    "kind": self.kinds[idx],
+                    "common_name": self.commons[idx],
+                    "scientific_name": self.scientifics[idx],
+                    "species_code": self.codes[idx],
+                    "match": match,
+                    "score": round(float(score[j]), 4)
+                })
+                if len(results) >= limit:
+                    break
+            if len(results) >= limit:
+                break
+
+        with self._lock:
+            self._results[key] = results
+            if len(self._results) > SUGGEST_RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return results
+
+
+SUGGEST_INDEX = {"index": None, "building": False}
+_suggest_lock = threading.Lock()
+# A build in flight at fork time has no thread in the child; let it start again
+run_in_each_process(lambda: SUGGEST_INDEX.update(building=False))
+
+
+def _build_suggest_index_in_background():
+    try:
+        taxonomy = TAXONOMY_CACHE["data"]
+        if taxonomy is None:
+            taxonomy = get_cached_taxonomy()
+        if taxonomy is not None:
+            index = SpeciesSuggestIndex(taxonomy)
+            SUGGEST_INDEX["index"] = index
     except Exception as e:
-        print(f"Error fetching eBird data: {e}")
-        return None
+        logger.warning("Error building suggest index: %s", e)
+    finally:
+        SUGGEST_INDEX["building"] = False
 
-def get_bird_occurrences(species_code, region_code="US"):
+
+def get_suggest_index():
     """
-    Get recent bird occurrences from eBird
+    Return the suggestion index for the current taxonomy. Never blocks on eBird or
+    on an index build: until the taxonomy arrives and its index is built (on a
+    background thread) the previous index keeps serving, at first BIRD_CLASSES only.
     """
+    taxonomy = TAXONOMY_CACHE["data"]
+    index = SUGGEST_INDEX["index"]
+    if index is not None and index.taxonomy is taxonomy:
+        return index
+    with _suggest_lock:
+        index = SUGGEST_INDEX["index"]
+        if index is None:
+            # BIRD_CLASSES-only index: small enough to build inline
+            index = SpeciesSuggestIndex(None)
+            SUGGEST_INDEX["index"] = index
+        if index.taxonomy is not taxonomy or taxonomy is None:
+            if not SUGGEST_INDEX["building"]:
+                SUGGEST_INDEX["building"] = True
+                threading.Thread(target=_build_suggest_index_in_background, name="suggest-index", daemon=True).start()
+    return index
+
+# --- Recent observations: region prefetcher + local per-species cache ---
+# A background thread pulls /data/obs/{region}/recent for each configured
+# region on a schedule and records which species were seen. That endpoint
+# returns only the latest sighting per species, so it is used solely to answer
+# "no recent sightings" ([]) for species missing from a fresh snapshot; the
+# sightings themselves come from the per-species endpoint, cached per key, and
+# concurrent misses for one key share a call.
+OCCURRENCE_PREFETCH_ENABLED = True
+OCCURRENCE_PREFETCH_REGIONS = ["US"]
+OCCURRENCE_PREFETCH_INTERVAL_SECONDS = 15 * 60  # 15 minutes
+OCCURRENCE_PREFETCH_TIMEOUT = (3, 30)  # Region snapshots are large
+OCCURRENCE_CACHE_TTL_SECONDS = 30 * 60  # 30 minutes
+OCCURRENCE_CACHE_MAX_ENTRIES = 20000
+OCCURRENCE_LOOKBACK_DAYS = 7
+
+
+class OccurrenceCache:
+    """TTL + LRU cache of recent observations keyed by (region, species code)."""
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (region, code) -> (fetched_at, observations)
+        self._snapshots = {}  # region -> (fetched_at, species codes seen) of the last regional pull
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, region, code):
+        """Cached observations, [] when a fresh regional snapshot has none, else None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((region, code))
+            if entry is not None and (now - entry[0]) < self.ttl_seconds:
+                self._entries.move_to_end((region, code))
+                self.hits += 1
+                return entry[1]
+            snapshot_at, seen = self._snapshots.get(region, (None, ()))
+            if snapshot_at is not None and (now - snapshot_at) < self.ttl_seconds and code not in seen:
+                self.hits += 1
+                return []
+            self.misses += 1
+            return None
+
+    def put(self, region, code, observations, fetched_at=None):
+        with self._lock:
+            self._put_locked(region, code, observations, fetched_at or time.time())
+
+    def _put_locked(self, region, code, observations, fetched_at):
+        self._entries[(region, code)] = (fetched_at, observations)
+        self._entries.move_to_end((region, code))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put_region_snapshot(self, region, species_codes, fetched_at):
+        with self._lock:
+            self._snapshots[region] = (fetched_at, frozenset(species_codes))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "region_snapshot_age_seconds": {r: round(time.time() - t, 1) for r, (t, _) in self._snapshots.items()}
+            }
+
+
+OCCURRENCE_CACHE = OccurrenceCache(OCCURRENCE_CACHE_TTL_SECONDS, OCCURRENCE_CACHE_MAX_ENTRIES)
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+_inflight_calls = {}
+_inflight_lock = threading.Lock()
+
+
+def coalesce_call(key, fn, wait_timeout):
+    """Run fn() once per key at a time; concurrent callers wait for and share its result."""
+    with _inflight_lock:
+        call = _inflight_calls.get(key)
+        leader = call is None
+        if leader:
+            call = _InFlightCall()
+            _inflight_calls[key] = call
+    if not leader:
+        call.event.wait(wait_timeout)
+        return call.result
     try:
-        url = f"https://api.ebird.org/v2/data/obs/{region_code}/recent/{species_code}"
-        headers = {"X-eBirdApiToken": EBIRD_API_KEY}
-        params = {"back": 7, "maxResults": 5}  # Last 7 days, max 5 results
+        call.result = fn()
+        return call.result
+    finally:
+        with _inflight_lock:
+            _inflight_calls.pop(key, None)
+        call.event.set()
+
+
+def _fetch_species_occurrences(species_code, region_code, timeout, deadline=None):
+    """Per-species eBird call; returns a list on success and None on any failure."""
+    try:
+        params = {"back": OCCURRENCE_LOOKBACK_DAYS, "maxResults": 5}  # Last 7 days, max 5 results
         # Use separate connect/read timeouts
-        response = requests.get(url, headers=headers, params=params, timeout=(3, 5))
-        
+        response = EBIRD_CLIENT.get(
+            f"/data/obs/{region_code}/recent/{species_code}", params=params, timeout=timeout, deadline=deadline
+        )
         if response.status_code == 200:
             return response.json()
-        return []
+        return None
     except Exception as e:
-        print(f"Error fetching occurrences: {e}")
-        return []
+        logger.warning("Error fetching occurrences: %s", e)
+        return None
+
+
+def peek_bird_occurrences(species_code, region_code="US"):
+    """Occurrences from the local cache only (None on a miss); never calls eBird."""
+    return OCCURRENCE_CACHE.get(region_code, species_code)
+
+
+def get_bird_occurrences(species_code, region_code="US", timeout=EBIRD_TIMEOUT, deadline=None):
+    """
+    Get recent bird occurrences, from the prefetched cache when possible and
+    otherwise from eBird (coalesced with any identical in-flight request)
+    """
+    cached = OCCURRENCE_CACHE.get(region_code, species_code)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        observations = _fetch_species_occurrences(species_code, region_code, timeout, deadline)
+        if observations is not None:
+            OCCURRENCE_CACHE.put(region_code, species_code, observations)
+        return observations
+
+    wait_timeout = sum(timeout) if isinstance(timeout, tuple) else timeout
+    if deadline is not None:
+        wait_timeout = max(0.0, min(wait_timeout, deadline - time.monotonic()))
+    observations = coalesce_call(("occurrences", region_code, species_code), fetch, wait_timeout)
+    return observations if observations is not None else []
+
+
+def prefetch_region_occurrences(region_code):
+    """Pull recent observations for a whole region and record which species were seen."""
+    params = {"back": OCCURRENCE_LOOKBACK_DAYS, "maxResults": 10000}
+    fetched_at = time.time()
+    response = EBIRD_CLIENT.get(f"/data/obs/{region_code}/recent", params=params, timeout=OCCURRENCE_PREFETCH_TIMEOUT)
+    response.raise_for_status()
+    species_codes = {obs.get("speciesCode") for obs in response.json() if obs.get("speciesCode")}
+    OCCURRENCE_CACHE.put_region_snapshot(region_code, species_codes, fetched_at)
+    return len(species_codes)
+
+
+def _occurrence_prefetch_loop():
+    while True:
+        for region in OCCURRENCE_PREFETCH_REGIONS:
+            try:
+                count = prefetch_region_occurrences(region)
+                logger.info("Prefetched recent observations for %d species in %s", count, region)
+            except Exception as e:
+                logger.warning("Error prefetching observations for %s: %s", region, e)
+        time.sleep(OCCURRENCE_PREFETCH_INTERVAL_SECONDS)
+
+
+if OCCURRENCE_PREFETCH_ENABLED:
+    run_in_each_process(lambda: threading.Thread(
+        target=_occurrence_prefetch_loop, name="occurrence-prefetch", daemon=True
+    ).start())
+
+def get_bird_details_from_api(species_name, budget=None, include_occurrences=True):
+    """
+    Get detailed bird information from multiple sources.
+    With a RequestBudget, upstream timeouts are clamped to the time left and the
+    occurrences call is skipped when there is not enough of it.
+    """
+    # Try to get info from eBird
+    deadline = budget.deadline() if budget is not None else None
+    timeout = budget.timeout() if budget is not None else EBIRD_TIMEOUT
+    ebird_info = get_ebird_species_info(species_name, timeout=timeout, deadline=deadline)
+
+    # Get recent occurrences if we have a species code
+    occurrences = None
+    if include_occurrences and ebird_info and ebird_info.get("speciesCode"):
+        occurrences = peek_bird_occurrences(ebird_info["speciesCode"])
+        if occurrences is None:
+            if budget is not None and not budget.has(MIN_OCCURRENCES_MS):
+                budget.degrade("occurrences", "skipped")
+            else:
+                timeout = budget.timeout() if budget is not None else EBIRD_TIMEOUT
+                occurrences = get_bird_occurrences(ebird_info["speciesCode"], timeout=timeout, deadline=deadline)
+
+    return build_bird_details(species_name, ebird_info, occurrences)
 
-def get_bird_details_from_api(species_name):
+def build_bird_details(species_name, ebird_info, occurrences=None):
     """
-    Get detailed bird information from multiple sources
+    Assemble the details dict for a species from its eBird taxonomy record and
+    (optionally) its recent occurrences.
     """
     details = {
         "common_name": species_name,
@@ -436,8 +2428,6 @@ def get_bird_details_from_api(species_name):
         "search_type": "unknown"  # Track if search was by common or scientific name
     }
     
-    # Try to get info from eBird
-    ebird_info = get_ebird_species_info(species_name)
     if ebird_info:
         # Determine search type based on what matched
         if ebird_info["sciName"].lower() == species_name.lower():
@@ -455,9 +2445,7 @@ def get_bird_details_from_api(species_name):
             "species_code": ebird_info.get("speciesCode", "")
         })
         
-        # Get recent occurrences if we have a species code
-        if ebird_info.get("speciesCode"):
-            occurrences = get_bird_occurrences(ebird_info["speciesCode"])
+        if occurrences is not None:
             details["occurrences"] = occurrences[:3]  # Limit to 3 recent sightings
         
         # Add some habitat and behavior information based on family/order
@@ -533,6 +2521,91 @@ def get_bird_details_from_api(species_name):
     
     return details
 
+# --- Bulk species search ---
+BULK_SEARCH_MAX_NAMES = 500
+BULK_OCCURRENCE_CONCURRENCY = 8  # Max in-flight eBird occurrence requests per bulk call
+
+def search_birds_bulk(names, include_occurrences=True):
+    """
+    Resolve many names in one pass over the taxonomy, fetch occurrences once per
+    distinct species concurrently over pooled connections, and return details in input order.
+    """
+    unique = OrderedDict()
+    for name in names:
+        unique.setdefault(name.strip().lower(), name.strip())
+
+    taxonomy = get_cached_taxonomy()
+    resolved = {}
+    for key, name in unique.items():
+        idx = taxonomy.find(name) if taxonomy else None
+        resolved[key] = taxonomy.record(idx) if idx is not None else None
+
+    occurrences = {}
+    if include_occurrences:
+        codes = list(dict.fromkeys(
+            info["speciesCode"] for info in resolved.values() if info and info.get("speciesCode")
+        ))
+        if codes:
+            workers = min(BULK_OCCURRENCE_CONCURRENCY, len(codes))
+            # Connections come from the shared EBIRD_CLIENT keep-alive pool
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                occurrences = dict(zip(codes, pool.map(get_bird_occurrences, codes)))
+
+    details_by_key = {}
+    for key, name in unique.items():
+        info = resolved[key]
+        occ = occurrences.get(info.get("speciesCode")) if info else None
+        details_by_key[key] = build_bird_details(name, info, occ) if info else None
+
+    results = []
+    for name in names:
+        details = details_by_key[name.strip().lower()]
+        results.append({
+            "query": name,
+            "found": details is not None,
+            "bird_details": details
+        })
+    return results, len(unique)
+
+# --- HTTP caching for search responses ---
+# Species details only change when the eBird taxonomy or our profile data does,
+# so responses carry an ETag derived from those versions and browsers/CDNs can
+# revalidate with If-None-Match / If-Modified-Since and get a 304. Full
+# responses also embed live occurrences, so they are cached briefly and their
+# ETag includes the occurrence data; slim responses omit them and live longer.
+PROFILE_SCHEMA_VERSION = 1  # Bump when build_bird_details output changes shape
+SEARCH_FULL_MAX_AGE_SECONDS = 5 * 60  # 5 minutes
+SEARCH_SLIM_MAX_AGE_SECONDS = 24 * 60 * 60  # Matches the taxonomy refresh interval
+SEARCH_STALE_WHILE_REVALIDATE_SECONDS = 60
+_PROFILE_VERSION = {"value": None}
+
+def get_profile_version():
+    """Version of the static profile data (FALLBACK_KB + schema), computed once."""
+    if _PROFILE_VERSION["value"] is None:
+        blob = json.dumps(FALLBACK_KB, sort_keys=True) + f"|{PROFILE_SCHEMA_VERSION}"
+        _PROFILE_VERSION["value"] = hashlib.sha256(blob.encode("utf-8")).hexdigest()[:12]
+    return _PROFILE_VERSION["value"]
+
+def is_truthy(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "slim")
+
+def cacheable_response(payload, status, etag_parts, max_age, last_modified=None):
+    """JSON response with ETag/Last-Modified/Cache-Control that answers conditional GETs with 304."""
+    resp = jsonify(payload)
+    resp.status_code = status
+    if TAXONOMY_CACHE["version"] is None:
+        # Answered without a taxonomy (eBird unavailable); don't let anyone cache that
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+    etag_source = "|".join(str(part) for part in etag_parts)
+    resp.set_etag(hashlib.sha256(etag_source.encode("utf-8")).hexdigest()[:24])
+    if last_modified:
+        resp.last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+    resp.headers['Cache-Control'] = (
+        f"public, max-age={max_age}, stale-while-revalidate={SEARCH_STALE_WHILE_REVALIDATE_SECONDS}"
+    )
+    return resp.make_conditional(request)
+
 # --- Static fallback knowledge base (minimal) ---
 FALLBACK_KB = {
     "Bald Eagle": {
@@ -660,6 +2733,7 @@ FALLBACK_KB = {
 }
 
 @app.route('/detect-bird', methods=['POST', 'OPTIONS'])
+@admission_controlled
 def detect_bird():
     if request.method == 'OPTIONS':
         return ('', 204)
@@ -670,22 +2744,40 @@ def detect_bird():
     if file.filename == '':
         return jsonify({'message': 'No image file selected'}), 400
 
-    img_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(img_path)
+    budget = RequestBudget(parse_deadline_ms(request), started=g.get('request_started'))
+    slim = is_truthy(request.values.get('slim', ''))
+    # per_bird=1 classifies every detected bird separately instead of pooling all crops
+    per_bird = is_truthy(request.values.get('per_bird', ''))
+    # Pin model versions for the whole request so a hot swap cannot mix them
+    models_in_use = MODEL_REGISTRY.snapshot()
+    detector = models_in_use["detector"]
+    classifier = models_in_use.get("classifier")
+    # Class ids differ between the COCO detector and fine-tuned bird weights; always go by name
+    class_names = detector.class_names or COCO_CLASSES
+
+    # Decode from memory; the upload store persists the bytes in the background
+    data = file.read()
+    if not data:
+        return jsonify({'message': 'Uploaded image is empty'}), 400
+    try:
+        image, image_format, original_size, decode_scale = decode_for_inference(data)
+    except Exception:
+        return jsonify({'message': 'Uploaded file is not a readable image'}), 400
+    upload_id = upload_store.put(data, image_format)
 
     try:
         # Run detection using basic YOLO inference
-        results = model(img_path, conf=0.1)  # Lower threshold to catch more birds
+        results = detector.model(image, conf=0.1, verbose=False)  # Lower threshold to catch more birds
         
         # Handle different YOLO result formats
         result = results[0] if isinstance(results, (list, tuple)) and len(results) > 0 else results
         
-        # Debug: Log the result type and structure
-        print(f"Detection result type: {type(result)}")
-        if hasattr(result, 'boxes') and result.boxes is not None:
-            print(f"Result has boxes: {result.boxes}")
-        elif hasattr(result, 'shape'):
-            print(f"Result is tensor with shape: {result.shape}")
+        # Debug: Log the result type and structure (sampled; built only when logged)
+        log_debug_sampled("Detection result", lambda: {
+            "result_type": type(result).__name__,
+            "boxes": str(result.boxes) if getattr(result, 'boxes', None) is not None else None,
+            "shape": list(result.shape) if hasattr(result, 'shape') else None
+        })
         
         # Initialize detection lists
         bird_detections = []
@@ -700,27 +2792,23 @@ def detect_bird():
                 conf_list = boxes.conf.tolist() if hasattr(boxes, 'conf') else []
                 xyxy_list = boxes.xyxy.tolist() if hasattr(boxes, 'xyxy') else []
                 
-                print(f"Parsing boxes format: {len(cls_list)} detections")
-                
                 num = min(len(cls_list), len(conf_list), len(xyxy_list))
                 for i in range(num):
                     class_id = int(cls_list[i])
                     confidence = float(conf_list[i])
                     bbox = xyxy_list[i]
                     
-                    if class_id < len(COCO_CLASSES):
-                        detected_objects.append({'class': COCO_CLASSES[class_id], 'confidence': confidence})
+                    class_name = class_names[class_id] if class_id < len(class_names) else None
+                    if class_name is not None:
+                        detected_objects.append({'class': class_name, 'confidence': confidence})
                     
-                    # Check if it's a bird (class 14) with lower threshold
-                    if class_id == 14 and confidence > 0.1:
-                        bird_detections.append({'confidence': confidence, 'bbox': bbox})
-                        print(f"Bird detected (boxes) with confidence: {confidence}")
+                    # Check if it's a bird with lower threshold
+                    if class_name == 'bird' and confidence > 0.1:
+                        bird_detections.append({'confidence': confidence, 'bbox': scale_bbox(bbox, decode_scale)})
         
         elif hasattr(result, 'shape') and len(result.shape) > 0:
             # Raw tensor format (N x 6: x1,y1,x2,y2,conf,cls)
             if len(result.shape) == 2 and result.shape[1] == 6:
-                print(f"Parsing raw tensor detections: {result.shape[0]}")
-                
                 for detection in result:
                     if len(detection) >= 6:
                         x1, y1, x2, y2, conf, cls = detection[:6]
@@ -728,23 +2816,29 @@ def detect_bird():
                         confidence = float(conf.item())
                         bbox = [float(x1.item()), float(y1.item()), float(x2.item()), float(y2.item())]
                         
-                        if class_id < len(COCO_CLASSES):
-                            detected_objects.append({'class': COCO_CLASSES[class_id], 'confidence': confidence})
+                        class_name = class_names[class_id] if class_id < len(class_names) else None
+                        if class_name is not None:
+                            detected_objects.append({'class': class_name, 'confidence': confidence})
                         
-                        # Check if it's a bird (class 14) with lower threshold
-                        if class_id == 14 and confidence > 0.1:
-                            bird_detections.append({'confidence': confidence, 'bbox': bbox})
-                            print(f"Bird detected (raw) with confidence: {confidence}")
+                        # Check if it's a bird with lower threshold
+                        if class_name == 'bird' and confidence > 0.1:
+                            bird_detections.append({'confidence': confidence, 'bbox': scale_bbox(bbox, decode_scale)})
         
-        # Log all detections for debugging
-        print(f"Total bird detections: {len(bird_detections)}")
-        print(f"All detected objects: {detected_objects}")
+        # Log all detections for debugging (sampled)
+        log_debug_sampled("Parsed detections", lambda: {
+            "bird_detections": [d['confidence'] for d in bird_detections],
+            "detected_objects": detected_objects
+        })
         
+        # Content filters only apply to classes the active detector actually has
+        model_classes = {name.lower() for name in class_names}
+
         # ANTI-HUMAN FILTER: Check for humans first and reject if found
-        human_detections = [obj for obj in detected_objects if obj['class'].lower() == 'person' and obj['confidence'] > 0.3]
+        human_classes = [c for c in ['person'] if c in model_classes]
+        human_detections = [obj for obj in detected_objects if obj['class'].lower() in human_classes and obj['confidence'] > 0.3]
         if human_detections:
             highest_human_conf = max(human_detections, key=lambda x: x['confidence'])['confidence']
-            print(f"Human detected with confidence {highest_human_conf:.3f} - rejecting image")
+            logger.info("Human detected - rejecting image", extra={"fields": {"confidence": highest_human_conf}})
             
             # Check if bird was also detected to provide better feedback
             bird_also_detected = len(bird_detections) > 0
@@ -762,13 +2856,15 @@ def detect_bird():
             }), 400
         
         # ANTI-NON-BIRD FILTER: Check for other common non-bird subjects
-        non_bird_animals = ['cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe']
+        non_bird_animals = [c for c in ['cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe'] if c in model_classes]
         animal_detections = [obj for obj in detected_objects 
                            if obj['class'].lower() in non_bird_animals and obj['confidence'] > 0.4]
         
         if animal_detections:
             detected_animal = max(animal_detections, key=lambda x: x['confidence'])
-            print(f"Non-bird animal detected: {detected_animal['class']} with confidence {detected_animal['confidence']:.3f}")
+            logger.info("Non-bird animal detected", extra={"fields": {
+                "class": detected_animal['class'], "confidence": detected_animal['confidence']
+            }})
             
             return jsonify({
                 'message': f"{detected_animal['class'].title()} photo detected. Please upload a photo of a bird.",
@@ -778,13 +2874,15 @@ def detect_bird():
             }), 400
         
         # INDOOR/OBJECT FILTER: Check for indoor objects that suggest non-bird photos
-        indoor_objects = ['bottle', 'cup', 'bowl', 'chair', 'couch', 'bed', 'dining table', 'tv', 'laptop', 'cell phone']
+        indoor_objects = [c for c in ['bottle', 'cup', 'bowl', 'chair', 'couch', 'bed', 'dining table', 'tv', 'laptop', 'cell phone'] if c in model_classes]
         high_conf_indoor = [obj for obj in detected_objects 
                           if obj['class'].lower() in indoor_objects and obj['confidence'] > 0.6]
         
         # If many indoor objects detected and no birds, likely indoor non-bird photo
         if len(high_conf_indoor) >= 2 and len(bird_detections) == 0:
-            print(f"Indoor objects detected without birds: {[obj['class'] for obj in high_conf_indoor]}")
+            logger.info("Indoor objects detected without birds", extra={"fields": {
+                "classes": [obj['class'] for obj in high_conf_indoor]
+            }})
             
             return jsonify({
                 'message': 'Indoor photo detected without birds. Please upload an outdoor bird photo.',
@@ -800,7 +2898,7 @@ def detect_bird():
             for obj in detected_objects:
                 obj_class = obj['class'].lower()
                 if any(keyword in obj_class for keyword in bird_keywords):
-                    print(f"Found bird-related object: {obj['class']} with confidence: {obj['confidence']}")
+                    logger.debug("Found bird-related object: %s (%.3f)", obj['class'], obj['confidence'])
                     # Add to bird detections with a note
                     bird_detections.append({
                         'confidence': obj['confidence'], 
@@ -813,11 +2911,11 @@ def detect_bird():
         if len(bird_detections) == 0:
             high_confidence_objects = [obj for obj in detected_objects if obj['confidence'] > 0.5]
             if high_confidence_objects:
-                print(f"No birds detected, but found high-confidence objects: {high_confidence_objects}")
+                logger.debug("No birds detected, but found high-confidence objects: %s", high_confidence_objects)
                 # Consider the highest confidence object as a potential bird
                 best_obj = max(high_confidence_objects, key=lambda x: x['confidence'])
                 if best_obj['confidence'] > 0.6:  # High confidence threshold
-                    print(f"Treating high-confidence object '{best_obj['class']}' as potential bird")
+                    logger.debug("Treating high-confidence object '%s' as potential bird", best_obj['class'])
                     bird_detections.append({
                         'confidence': best_obj['confidence'],
                         'bbox': [0, 0, 100, 100],
@@ -831,20 +2929,58 @@ def detect_bird():
                 'detected_objects': detected_objects
             })
 
+        # Stop here if the client went away while we were detecting
+        if client_disconnected(request.environ):
+            INFERENCE_GATE.record_cancel()
+            return client_closed_response()
+
         # --- NEW: Crop detected birds and classify top-k over crops ---
+        # Merge duplicate boxes, rank by confidence and size, then trim to what the budget allows
+        ranked = rank_detections(merge_overlapping_detections(bird_detections), original_size)
+        crop_cap = PER_BIRD_MAX_CROPS if per_bird else MAX_CROPS
+        crop_limit = budget.crop_limit(len(ranked), cap=crop_cap)
+        # Per-bird responses promise every bird, so the cap counts as degradation there too
+        if crop_limit < (len(ranked) if per_bird else min(len(ranked), crop_cap)):
+            budget.degrade("crops", f"limited to {crop_limit} of {len(ranked)}")
         crops = []
-        for det in bird_detections:
+        cropped_detections = []
+        for det in ranked[:crop_limit]:
             bbox = det.get('bbox')
             if bbox and len(bbox) == 4:
                 try:
-                    crops.append(crop_with_padding(img_path, bbox, pad_ratio=0.15))
+                    # Detections are reported in original coordinates; crop from the decoded image
+                    decoded_bbox = scale_bbox(bbox, (1.0 / decode_scale[0], 1.0 / decode_scale[1]))
+                    crops.append(crop_with_padding(image, decoded_bbox, pad_ratio=0.15))
+                    cropped_detections.append(det)
                 except Exception as e:
-                    print(f"Crop error: {e}")
+                    logger.warning("Crop error: %s", e)
         if not crops:
             # fallback: whole image crop
-            crops = [Image.open(img_path).convert('RGB')]
+            crops = [image]
+            cropped_detections = [{'confidence': ranked[0].get('confidence', 0.0), 'bbox': None}]
 
-        best_pred, top_preds = classify_topk_on_crops(crops, top_k=5)
+        birds = None
+        if per_bird:
+            birds = []
+            for det, preds in zip(cropped_detections, classify_each_crop(crops, top_k=3, classifier=classifier)):
+                best = preds[0] if preds else None
+                birds.append({
+                    "bbox": det.get('bbox'),
+                    "detection_confidence": det.get('confidence', 0.0),
+                    "merged": det.get('merged', 0),
+                    "species": best['species'] if best else 'Bird (Species Unknown)',
+                    "confidence": float(best['confidence']) if best else 0.0,
+                    "alternatives": [
+                        {"species": p['species'], "confidence": float(p['confidence'])} for p in preds[1:]
+                    ]
+                })
+            # The headline species is the single most confident bird, which is
+            # what max-pooling over the same probabilities would pick
+            lead = max(birds, key=lambda b: b['confidence'])
+            best_pred = {"species": lead['species'], "confidence": lead['confidence']} if lead['confidence'] > 0 else None
+            top_preds = [best_pred] + lead['alternatives'] if best_pred else []
+        else:
+            best_pred, top_preds = classify_topk_on_crops(crops, top_k=5, classifier=classifier)
         if not best_pred:
             # Fallback to previous analysis if classifier not available
             species_name = 'Bird (Species Unknown)'
@@ -859,18 +2995,28 @@ def detect_bird():
                 for p in (top_preds[1:] if len(top_preds) > 1 else [])
             ]
 
-        print(f"Top species prediction: {species_name} (confidence: {species_conf:.3f})")
+        logger.info("Top species prediction", extra={"fields": {
+            "species": species_name,
+            "confidence": round(species_conf, 4),
+            "birds": len(bird_detections),
+            "birds_classified": len(crops),
+            "model_versions": {kind: v.version for kind, v in models_in_use.items()}
+        }})
+
+        if client_disconnected(request.environ):
+            INFERENCE_GATE.record_cancel()
+            return client_closed_response()
 
         # Build rich profile (20+ fields), enriched via eBird helpers
         # Always build a rich profile; low confidence will be noted in the response
-        profile = build_rich_profile(species_name, species_conf, alternatives)
+        profile = build_rich_profile(species_name, species_conf, alternatives, budget=budget)
 
         low_conf = species_conf < 0.2
         advice = None
         if low_conf:
             advice = "Low confidence. Try a clearer, closer photo, and optionally provide location and time for better accuracy."
 
-        return jsonify({
+        result = {
             "message": f"Bird detected! Species: {profile['common_name']}",
             "species": profile['common_name'],
             "scientific_name": profile['scientific_name'],
@@ -880,10 +3026,23 @@ def detect_bird():
             "confidence": species_conf,
             "alternatives": profile.get("alternatives", []),
             "low_confidence": low_conf,
-            "advice": advice
-        })
+            "advice": advice,
+            "degraded": budget.degraded,
+            "budget": budget.summary(),
+            "upload_id": upload_id,
+            "image_size": {"original": list(original_size), "decoded": list(image.size)},
+            "model_versions": {kind: v.version for kind, v in models_in_use.items()}
+        }
+        if birds is not None:
+            result["birds"] = birds
+            result["bird_count"] = len(ranked)
+        if slim:
+            # Clients fetch the full profile from the cacheable /search-bird instead
+            result.pop("profile")
+        return jsonify(result)
 
     except Exception as e:
+        logger.exception("Error processing image")
         return jsonify({'message': f'Error processing image: {str(e)}'}), 500
 
 @app.route('/search-bird', methods=['GET'])
@@ -891,8 +3050,18 @@ def search_bird():
     species_name = request.args.get('name')
     if not species_name:
         return jsonify({'message': 'Please provide a bird name in the "name" query parameter.'}), 400
+    # Slim responses skip the live occurrences subtree and can be cached for a day
+    slim = is_truthy(request.args.get('slim', '')) or request.args.get('view') == 'slim'
+
+    bird_details = get_bird_details_from_api(species_name, include_occurrences=not slim)
+    if slim and bird_details:
+        bird_details.pop("occurrences", None)
+    etag_parts = [TAXONOMY_CACHE["version"], get_profile_version(), species_name.strip().lower(), slim]
+    if not slim and bird_details:
+        etag_parts.append(json.dumps(bird_details.get("occurrences", []), sort_keys=True, default=str))
+    max_age = SEARCH_SLIM_MAX_AGE_SECONDS if slim else SEARCH_FULL_MAX_AGE_SECONDS
+    last_modified = TAXONOMY_CACHE["modified_at"] if slim else None
 
-    bird_details = get_bird_details_from_api(species_name)
     if bird_details and bird_details.get("scientific_name"):
         # Create appropriate message based on search type
         if bird_details.get("search_type") == "scientific":
@@ -900,16 +3069,133 @@ def search_bird():
         else:
             message = f'Detailed information found for "{species_name}".'
         
-        return jsonify({
+        return cacheable_response({
             'message': message,
             'bird_details': bird_details
-        })
+        }, 200, etag_parts, max_age, last_modified)
     else:
-        return jsonify({'message': f'No information found for "{species_name}".'}), 404
+        return cacheable_response(
+            {'message': f'No information found for "{species_name}".'}, 404, etag_parts, max_age, last_modified
+        )
+
+@app.route('/search-birds', methods=['POST', 'OPTIONS'])
+def search_birds():
+    if request.method == 'OPTIONS':
+        return ('', 204)
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'message': 'Please send a JSON object with a "names" list.'}), 400
+    names = payload.get('names')
+    if not isinstance(names, list) or not names:
+        return jsonify({'message': 'Please provide a non-empty "names" list in the JSON body.'}), 400
+    names = [n for n in names if isinstance(n, str) and n.strip()]
+    if not names:
+        return jsonify({'message': 'No valid bird names provided.'}), 400
+    if len(names) > BULK_SEARCH_MAX_NAMES:
+        return jsonify({'message': f'Too many names; the limit is {BULK_SEARCH_MAX_NAMES} per request.'}), 400
+
+    started = time.perf_counter()
+    results, unique_count = search_birds_bulk(names, include_occurrences=is_truthy(payload.get('occurrences', True)))
+    return jsonify({
+        'message': f'Resolved {sum(1 for r in results if r["found"])} of {len(results)} names.',
+        'results': results,
+        'unique_names': unique_count,
+        'took_ms': round((time.perf_counter() - started) * 1000.0, 1)
+    })
+
+@app.route('/suggest-bird', methods=['GET'])
+def suggest_bird():
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({'message': 'Please provide a partial bird name in the "q" query parameter.'}), 400
+    try:
+        limit = int(request.args.get('limit', SUGGEST_DEFAULT_LIMIT))
+    except ValueError:
+        limit = SUGGEST_DEFAULT_LIMIT
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+
+    started = time.perf_counter()
+    index = get_suggest_index()
+    suggestions = index.suggest(query, limit=limit)
+    return jsonify({
+        'query': query,
+        'suggestions': suggestions,
+        'took_ms': round((time.perf_counter() - started) * 1000.0, 3)
+    })
+
+def is_admin_request(req):
+    # No localhost exemption: behind a reverse proxy every request comes from 127.0.0.1
+    if not MODEL_ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(req.headers.get('X-Admin-Token', '').encode(), MODEL_ADMIN_TOKEN.encode())
+
+def admin_denied_response():
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({'message': 'Admin routes are disabled. Set BIRDSCAN_ADMIN_TOKEN to enable them.'}), 403
+    return jsonify({'message': 'Not authorized'}), 403
+
+@app.route('/autotune', methods=['GET', 'POST'])
+def autotune():
+    if request.method == 'POST':
+        if not is_admin_request(request):
+            return admin_denied_response()
+        if not start_autotune():
+            return jsonify({'message': 'Autotune is already running.'}), 409
+        return jsonify({'message': 'Autotune started in the background. Inference pauses while it runs, so run it off-peak.'}), 202
+    return jsonify({
+        'settings': INFERENCE_SETTINGS,
+        'running': AUTOTUNE_STATE['running'],
+        'last_error': AUTOTUNE_STATE['last_error'],
+        'profile': AUTOTUNE_STATE['profile'],
+        'fingerprint': host_fingerprint()
+    })
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify({'models': MODEL_REGISTRY.status()})
+
+@app.route('/models/<kind>/load', methods=['POST'])
+def load_model(kind):
+    if not is_admin_request(request):
+        return admin_denied_response()
+    if kind not in MODEL_KINDS:
+        return jsonify({'message': f'Unknown model kind "{kind}".'}), 404
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'message': 'Please send a JSON object.'}), 400
+    path = resolve_weights_source(kind, payload.get('source', 'latest'))
+    if path is None:
+        return jsonify({'message': 'No loadable weights found for that source.'}), 400
+    if not MODEL_REGISTRY.load_async(kind, path):
+        return jsonify({'message': f'A {kind} is already loading.'}), 409
+    # Loading anything but the newest weights pins it: the watcher leaves it alone until newer ones appear
+    latest = discover_latest_weights(kind)
+    pinned_past = weights_version_name(latest) if latest and os.path.realpath(latest) != os.path.realpath(path) else None
+    MODEL_REGISTRY.hold_back(kind, pinned_past)
+    return jsonify({'message': f'Loading {kind} from {path} in the background.', 'source': path}), 202
+
+@app.route('/models/<kind>/rollback', methods=['POST'])
+def rollback_model(kind):
+    if not is_admin_request(request):
+        return admin_denied_response()
+    if kind not in MODEL_KINDS:
+        return jsonify({'message': f'Unknown model kind "{kind}".'}), 404
+    restored = MODEL_REGISTRY.rollback(kind)
+    if restored is None:
+        return jsonify({'message': f'No previous {kind} version to roll back to.'}), 409
+    return jsonify({'message': f'Rolled {kind} back to {restored.version}.', 'active': restored.describe()})
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'BirdScan AI Backend is running'})
+    return jsonify({
+        'status': 'healthy',
+        'message': 'BirdScan AI Backend is running',
+        'uploads': upload_store.stats(),
+        'occurrences': OCCURRENCE_CACHE.stats(),
+        'ebird_client': EBIRD_CLIENT.stats(),
+        'inference': INFERENCE_GATE.stats(),
+        'logging': {'level': LOG_LEVEL, 'dropped_records': NonBlockingQueueHandler.dropped}
+    })
 
 @app.route('/test', methods=['GET', 'POST'])
 def test_endpoint():
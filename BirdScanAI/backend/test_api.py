@@ -24,6 +24,35 @@ def test_search_endpoint():
         print(f"Search test failed: {e}")
         return False
 
+def test_suggest_endpoint():
+    """Test the species autocomplete endpoint"""
+    try:
+        response = requests.get("http://127.0.0.1:5001/suggest-bird?q=blue%20magp&limit=5")
+        print(f"Suggest test: {response.status_code}")
+        if response.status_code == 200:
+            data = response.json()
+            names = [s.get('name') for s in data.get('suggestions', [])]
+            print(f"Suggestions ({data.get('took_ms')} ms): {names}")
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Suggest test failed: {e}")
+        return False
+
+def test_bulk_search_endpoint():
+    """Test the bulk species search endpoint"""
+    try:
+        names = ["American Robin", "american robin", "Turdus migratorius", "Blue Jay"]
+        response = requests.post("http://127.0.0.1:5001/search-birds", json={"names": names})
+        print(f"Bulk search test: {response.status_code}")
+        if response.status_code == 200:
+            data = response.json()
+            print(f"{data.get('message')} ({data.get('unique_names')} unique, {data.get('took_ms')} ms)")
+            return len(data.get('results', [])) == len(names)
+        return False
+    except Exception as e:
+        print(f"Bulk search test failed: {e}")
+        return False
+
 if __name__ == "__main__":
     print("Testing BirdScan AI API...")
     
@@ -36,7 +65,13 @@ if __name__ == "__main__":
     # Test search endpoint
     search_ok = test_search_endpoint()
     
-    if health_ok and search_ok:
+    # Test suggest endpoint
+    suggest_ok = test_suggest_endpoint()
+    
+    # Test bulk search endpoint
+    bulk_ok = test_bulk_search_endpoint()
+    
+    if health_ok and search_ok and suggest_ok and bulk_ok:
         print("✅ API tests passed!")
     else:
         print("❌ Some API tests failed!") 
\ No newline at end of file
@@ -0,0 +1,387 @@
+"""
+Unit tests for the helpers in main.py (no running server or eBird access needed).
+Run from the backend directory: python -m pytest test_main.py
+"""
+import io
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+import main
+
+
+@pytest.fixture
+def silent_ebird(monkeypatch):
+    """Point the eBird client at a local server that accepts connections but never replies."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(50)
+    accepted = []
+
+    def accept_forever():
+        while True:
+            try:
+                accepted.append(server.accept())
+            except OSError:
+                return
+
+    threading.Thread(target=accept_forever, daemon=True).start()
+    monkeypatch.setattr(main, "EBIRD_BASE_URL", f"http://127.0.0.1:{server.getsockname()[1]}")
+    monkeypatch.setattr(main, "EBIRD_CLIENT", main.EbirdClient("test-key"))
+    monkeypatch.setattr(main, "TAXONOMY_CACHE", {"data": None, "fetched_at": 0.0, "version": None, "modified_at": None})
+    yield
+    server.close()
+    for conn, _ in accepted:
+        conn.close()
+
+
+@pytest.mark.parametrize("deadline_ms", [300, 1000])
+def test_budgeted_lookup_returns_within_deadline(silent_ebird, deadline_ms):
+    budget = main.RequestBudget(deadline_ms=deadline_ms)
+    started = time.monotonic()
+    details = main.get_enrichment_within_budget("American Robin", budget)
+    elapsed_ms = (time.monotonic() - started) * 1000.0
+
+    assert details is None
+    assert budget.degraded.get("enrichment") == "fallback"
+    assert elapsed_ms < deadline_ms + 50
+
+
+def test_budget_timeout_fits_remaining_time():
+    budget = main.RequestBudget(deadline_ms=500)
+    connect, read = budget.timeout()
+    assert connect + read <= 0.5
+    assert main.RequestBudget().timeout() == main.EBIRD_TIMEOUT
+
+
+def _wait_for(predicate, timeout=5.0):
+    give_up_at = time.monotonic() + timeout
+    while time.monotonic() < give_up_at:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_upload_store_rewrites_file_evicted_elsewhere(tmp_path):
+    store = main.UploadStore(str(tmp_path), max_bytes=10 ** 9, max_files=100, max_age_seconds=3600)
+    data = b"image-bytes"
+    digest = store.put(data, "PNG")
+    path = tmp_path / main.UploadStore.relative_path(digest, ".png")
+    assert _wait_for(path.exists)
+
+    path.unlink()  # e.g. evicted by another worker process
+    store.put(data, "PNG")
+    assert _wait_for(path.exists)
+    assert store.stats()["files"] == 1
+
+
+def test_upload_store_has_a_single_eviction_owner(tmp_path):
+    if main.fcntl is None:
+        pytest.skip("eviction lock needs fcntl")
+    first = main.UploadStore(str(tmp_path), 10 ** 9, 100, 3600, enabled=False)
+    second = main.UploadStore(str(tmp_path), 10 ** 9, 100, 3600, enabled=False)
+    assert first._owns_eviction()
+    assert not second._owns_eviction()
+
+
+TAXONOMY_RECORDS = [
+    {"speciesCode": "grtowl", "comName": "Great Owl", "sciName": "Strix magna", "category": "species",
+     "taxonOrder": 1.0, "bandingCodes": ["GROW"], "comNameCodes": [], "sciNameCodes": ["STMA"],
+     "order": "Strigiformes", "familyCode": "strigi1", "familyComName": "Owls", "familySciName": "Strigidae"},
+    {"speciesCode": "owl1", "comName": "Owl", "sciName": "Bubo owl", "category": "species",
+     "taxonOrder": 2.0, "bandingCodes": [], "comNameCodes": [], "sciNameCodes": [],
+     "order": "Strigiformes", "familyCode": "strigi1", "familyComName": "Owls", "familySciName": "Strigidae"},
+    {"speciesCode": "strow", "comName": "Strix Watcher", "sciName": "Owl", "category": "species",
+     "taxonOrder": 3.0, "bandingCodes": [], "comNameCodes": [], "sciNameCodes": [],
+     "order": "Strigiformes", "familyCode": "strigi1", "familyComName": "Owls", "familySciName": "Strigidae",
+     "extinct": True, "extinctYear": 1900, "reportAs": "owl1"},
+    {"speciesCode": "blujay", "comName": "Blue Jay", "sciName": "Cyanocitta cristata", "category": "species",
+     "taxonOrder": 4.0, "bandingCodes": ["BLJA"], "comNameCodes": [], "sciNameCodes": [],
+     "order": "Passeriformes", "familyCode": "corvid1", "familyComName": "Crows, Jays, and Magpies",
+     "familySciName": "Corvidae"},
+]
+
+
+def _linear_find(records, name):
+    """The lookup CompactTaxonomy.find replaced: four linear scans in precedence order."""
+    q = name.lower()
+    for matches in (
+        lambda r: r["comName"].lower() == q,
+        lambda r: r["sciName"].lower() == q,
+        lambda r: q in r["comName"].lower(),
+        lambda r: q in r["sciName"].lower(),
+    ):
+        for i, r in enumerate(records):
+            if matches(r):
+                return i
+    return None
+
+
+@pytest.fixture
+def taxonomy():
+    return main.CompactTaxonomy(TAXONOMY_RECORDS)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("owl", 1),             # exact common name beats an earlier partial match
+    ("OWL", 1),             # case-insensitive
+    ("strix magna", 0),     # exact scientific name
+    ("strix", 2),           # partial common name beats partial scientific
+    ("cristata", 3),        # partial scientific name
+    ("great", 0),
+    ("", 0),                # empty query matches the first row, like "" in name
+    ("owl\nblue", None),    # never matches across row boundaries
+    ("\n", None),
+    ("nothing like it", None),
+])
+def test_taxonomy_find_precedence(taxonomy, query, expected):
+    assert taxonomy.find(query) == expected
+    assert _linear_find(TAXONOMY_RECORDS, query) == expected
+
+
+def test_taxonomy_record_round_trip(taxonomy):
+    assert len(taxonomy) == len(TAXONOMY_RECORDS)
+    for i, original in enumerate(TAXONOMY_RECORDS):
+        assert taxonomy.record(i) == original
+    assert set(taxonomy.extras) == {2}
+
+
+def _jpeg_bytes(size, orientation=None):
+    from PIL import Image
+    img = Image.new("RGB", size)
+    buf = io.BytesIO()
+    if orientation is None:
+        img.save(buf, "JPEG")
+    else:
+        exif = img.getexif()
+        exif[0x0112] = orientation
+        img.save(buf, "JPEG", exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def test_decode_for_inference_uses_draft_scale():
+    img, image_format, original_size, scale = main.decode_for_inference(_jpeg_bytes((4000, 3000)))
+    assert image_format == "JPEG"
+    assert original_size == (4000, 3000)
+    assert img.size == (2000, 1500)
+    assert scale == (2.0, 2.0)
+
+
+def test_decode_for_inference_applies_exif_rotation():
+    img, _, original_size, scale = main.decode_for_inference(_jpeg_bytes((4000, 3000), orientation=6))
+    assert original_size == (3000, 4000)
+    assert img.size == (1500, 2000)
+    assert scale == (2.0, 2.0)
+
+
+def test_decode_for_inference_keeps_small_images():
+    img, _, original_size, scale = main.decode_for_inference(_jpeg_bytes((640, 480)))
+    assert img.size == original_size == (640, 480)
+    assert scale == (1.0, 1.0)
+
+
+def test_scale_bbox_round_trip():
+    bbox = [10.0, 20.0, 110.0, 220.0]
+    original = main.scale_bbox(bbox, (2.0, 2.5))
+    assert original == [20.0, 50.0, 220.0, 550.0]
+    assert main.scale_bbox(original, (0.5, 0.4)) == pytest.approx(bbox)
+
+
+class _FakeSession:
+    """Stands in for requests.Session: raises `error` if set, else returns a 200 response."""
+
+    def __init__(self):
+        self.error = None
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error("upstream failure")
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+@pytest.fixture
+def breaker_client(monkeypatch):
+    monkeypatch.setattr(main, "EBIRD_MAX_RETRIES", 0)
+    monkeypatch.setattr(main, "EBIRD_BREAKER_COOLDOWN_SECONDS", 0.05)
+    client = main.EbirdClient("test-key")
+    client.session = _FakeSession()
+    return client
+
+
+def _trip(client):
+    client.session.error = requests.ConnectionError
+    for _ in range(main.EBIRD_BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(requests.ConnectionError):
+            client.get("/x")
+
+
+def test_breaker_opens_after_consecutive_failures(breaker_client):
+    _trip(breaker_client)
+    assert breaker_client.state == "open"
+    calls = breaker_client.session.calls
+    with pytest.raises(main.CircuitOpenError):
+        breaker_client.get("/x")
+    assert breaker_client.session.calls == calls  # short-circuited, no upstream call
+
+
+def test_breaker_half_open_allows_one_trial(breaker_client):
+    _trip(breaker_client)
+    time.sleep(0.06)
+    assert breaker_client.state == "half-open"
+    assert breaker_client._allow_request()
+    assert not breaker_client._allow_request()
+
+
+@pytest.mark.parametrize("trial_error", [
+    requests.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.TooManyRedirects,
+])
+def test_breaker_recovers_after_failed_trial(breaker_client, trial_error):
+    _trip(breaker_client)
+    time.sleep(0.06)
+    breaker_client.session.error = trial_error
+    with pytest.raises(trial_error):
+        breaker_client.get("/x")
+    assert breaker_client.state == "open"
+
+    time.sleep(0.06)
+    breaker_client.session.error = None
+    assert breaker_client.get("/x").status_code == 200
+    assert breaker_client.state == "closed"
+
+
+def test_clamp_timeout():
+    assert main.clamp_timeout((3, 5), 10) == (3, 5)
+    assert sum(main.clamp_timeout((3, 5), 0.4)) == pytest.approx(0.4)
+    assert main.clamp_timeout(2.0, 0.5) == 0.5
+    assert main.clamp_timeout((3, 5), 0) is None
+
+
+def test_inference_gate_admits_up_to_concurrency_then_times_out():
+    gate = main.InferenceGate(max_concurrency=1, max_queue=2)
+    assert gate.enter({}, max_wait=0.1) is None
+    assert gate.enter({}, max_wait=0.1) == "timeout"
+    gate.leave(0.5)
+    assert gate.enter({}, max_wait=0.1) is None
+    stats = gate.stats()
+    assert stats["admitted"] == 2 and stats["timed_out"] == 1 and stats["running"] == 1
+
+
+def test_inference_gate_rejects_when_queue_is_full():
+    gate = main.InferenceGate(max_concurrency=1, max_queue=1)
+    assert gate.enter({}, max_wait=1.0) is None
+    waiter = threading.Thread(target=gate.enter, args=({}, 0.5))
+    waiter.start()
+    assert _wait_for(lambda: gate.stats()["waiting"] == 1)
+    assert gate.enter({}, max_wait=0.5) == "queue_full"
+    waiter.join()
+    assert gate.stats()["rejected"] == 1
+
+
+def test_inference_gate_hold_all_blocks_admission():
+    gate = main.InferenceGate(max_concurrency=2, max_queue=4)
+    with gate.hold_all(timeout=1.0):
+        assert gate.enter({}, max_wait=0.1) == "timeout"
+    assert gate.enter({}, max_wait=0.1) is None
+
+
+def test_inference_gate_resize_admits_more():
+    gate = main.InferenceGate(max_concurrency=1, max_queue=4)
+    assert gate.enter({}, max_wait=0.1) is None
+    assert gate.enter({}, max_wait=0.1) == "timeout"
+    gate.resize(2)
+    assert gate.enter({}, max_wait=0.1) is None
+    assert gate.stats()["running"] == 2
+
+
+def test_slot_candidates_fill_cores(monkeypatch):
+    monkeypatch.setattr(main.os, "cpu_count", lambda: 8)
+    assert main._slot_candidates() == [(1, 8), (2, 4), (4, 2), (8, 1)]
+
+
+def test_pick_fastest_breaks_ties_on_latency():
+    throughputs = {"a": 10.0, "b": 9.8, "c": 6.0}
+    latencies = {"a": 400.0, "b": 200.0, "c": 100.0}
+    assert main._pick_fastest(throughputs, latencies) == "b"
+
+
+def test_client_disconnected_without_socket():
+    assert main.client_disconnected({}) is False
+
+
+def test_merge_overlapping_detections_keeps_most_confident():
+    detections = [
+        {"confidence": 0.5, "bbox": [0, 0, 100, 100]},
+        {"confidence": 0.9, "bbox": [2, 2, 100, 100]},     # duplicate of the first, more confident
+        {"confidence": 0.7, "bbox": [200, 0, 300, 100]},   # separate bird
+        {"confidence": 0.6, "bbox": [50, 0, 150, 100]},    # overlaps the first at IoU 1/3: kept
+    ]
+    merged = main.merge_overlapping_detections(detections)
+    assert [d["confidence"] for d in merged] == [0.9, 0.7, 0.6]
+    assert merged[0]["merged"] == 1
+    assert "merged" not in merged[1]
+    assert "merged" not in detections[1]  # inputs are not modified
+
+
+def test_box_iou():
+    assert main.box_iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert main.box_iou([0, 0, 10, 10], [20, 20, 30, 30]) == 0.0
+    assert main.box_iou([0, 0, 10, 10], [5, 0, 15, 10]) == pytest.approx(1 / 3)
+
+
+def test_rank_detections_weighs_confidence_by_size():
+    small_confident = {"confidence": 0.9, "bbox": [0, 0, 10, 10]}
+    large_less_confident = {"confidence": 0.6, "bbox": [0, 0, 200, 200]}
+    ranked = main.rank_detections([small_confident, large_less_confident], (1000, 1000))
+    assert ranked == [large_less_confident, small_confident]
+
+
+@pytest.mark.parametrize("body", [["x"], "names", 3, None])
+def test_bulk_search_rejects_non_object_bodies(body):
+    response = main.app.test_client().post("/search-birds", json=body)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("flag, expected", [(True, True), (False, False), ("false", False), ("0", False), ("1", True)])
+def test_bulk_search_occurrences_flag(monkeypatch, flag, expected):
+    seen = {}
+
+    def fake_bulk(names, include_occurrences=True):
+        seen["include_occurrences"] = include_occurrences
+        return [], 0
+
+    monkeypatch.setattr(main, "search_birds_bulk", fake_bulk)
+    response = main.app.test_client().post("/search-birds", json={"names": ["Blue Jay"], "occurrences": flag})
+    assert response.status_code == 200
+    assert seen["include_occurrences"] is expected
+
+
+def test_model_watcher_respects_rollback(monkeypatch):
+    registry = main.ModelRegistry()
+    registry.register(main.ModelVersion("detector", "train2-best", object(), "runs/detect/train2/weights/best.pt"))
+    registry.register(main.ModelVersion("detector", "train3-best", object(), "runs/detect/train3/weights/best.pt"))
+    loads = []
+    latest = {"name": "train3-best"}
+    monkeypatch.setattr(main, "MODEL_REGISTRY", registry)
+    monkeypatch.setattr(registry, "load_async", lambda kind, path: loads.append(path) or True)
+    monkeypatch.setattr(main, "discover_latest_weights", lambda kind: f"runs/detect/{latest['name']}/weights/best.pt")
+    monkeypatch.setattr(main, "weights_version_name", lambda path: path.split("/")[2])
+
+    assert not main.check_for_new_weights("detector")  # newest is already active
+    assert registry.rollback("detector").version == "train2-best"
+    assert registry.held_back("detector") == "train3-best"
+    assert not main.check_for_new_weights("detector")  # rollback is not undone
+    assert loads == []
+
+    latest["name"] = "train4-best"
+    assert main.check_for_new_weights("detector")
+    assert loads == ["runs/detect/train4-best/weights/best.pt"]